@@ -0,0 +1,351 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+import concurrent.futures
+
+from collections import Counter
+
+import functions
+from functioncall import ModelInference
+from result_store import ResultStore
+from sandbox import configure_sandbox
+from instrumentation import build_instrumentation
+from model_loader import add_model_arguments, model_options
+from utils import inference_logger, LogPayload
+
+# how long a batch waits for prompts that are still being rendered or tokenized
+BATCH_FILL_SECONDS = 0.1
+
+
+class BatchSession:
+    """state of one query moving through the batched function calling loop"""
+
+    def __init__(self, record_id, query, expected_calls, prompt):
+        self.record_id = record_id
+        self.query = query
+        self.expected_calls = expected_calls
+        self.prompt = prompt
+        self.input_ids = None
+        self.depth = 0
+        self.iterations = 0
+        self.tool_calls = []
+        self.generated_tokens = 0
+        self.generation_seconds = 0.0
+        self.started = time.perf_counter()
+        self.result_store = None
+        self.tool_session = {}
+
+
+def read_records(input_path, id_field, query_field, skip_ids):
+    """stream (record_id, query, expected_calls, error) from a JSONL file, skipping ids already present in the output"""
+    with open(input_path, 'r') as file:
+        for line_number, line in enumerate(file):
+            line = line.strip()
+            if not line:
+                continue
+            error = None
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record, error = None, f"Could not decode record: {e}"
+            if error is None and not isinstance(record, dict):
+                error = f"Record is not a json object ({type(record).__name__})"
+            if error is not None:
+                # no id to read, so name the line; a line number alone could clash with a real id
+                record = {id_field: f"line {line_number + 1}"}
+            elif not isinstance(record.get(query_field), str):
+                error = f"Record has no {query_field} text"
+            record_id = str(record.get(id_field, line_number))
+            if record_id in skip_ids:
+                continue
+            yield record_id, record.get(query_field), record.get("expected_calls"), error
+
+
+def read_completed_ids(output_path):
+    """ids already written by an earlier (possibly crashed) run; a torn last line is ignored"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, 'r') as file:
+        for line in file:
+            try:
+                completed.add(str(json.loads(line)["id"]))
+            except (json.JSONDecodeError, KeyError):
+                continue
+    return completed
+
+
+def canonical_call(tool_call):
+    return json.dumps({"name": tool_call.get("name"), "arguments": tool_call.get("arguments", {})}, sort_keys=True)
+
+
+def score_tool_calls(tool_calls, expected_calls):
+    """exact match of the multiset of calls made against the expected calls, plus recall of expected names"""
+    made = Counter(canonical_call(call) for call in tool_calls)
+    expected = Counter(canonical_call(call) for call in expected_calls)
+    made_names = Counter(call.get("name") for call in tool_calls)
+    expected_names = Counter(call.get("name") for call in expected_calls)
+    name_hits = sum((made_names & expected_names).values())
+    return {
+        "exact_match": made == expected,
+        "name_recall": name_hits / max(sum(expected_names.values()), 1),
+    }
+
+
+class BatchRunner:
+    """
+    Run the function calling loop over a JSONL file of queries with batched generation.
+
+    Prompt rendering and tokenization run on a pool of CPU threads, and parsing,
+    validation and tool execution of one batch overlap with generation of the next.
+    Each finished query is appended to the output JSONL immediately, so an interrupted
+    run resumes from where it stopped.
+    """
+
+    def __init__(self, inference, chat_template, num_fewshot=None, max_depth=5, batch_size=8,
+                 max_in_flight=None, cpu_workers=4, share_results=True):
+        self.inference = inference
+        self.chat_template = chat_template
+        self.num_fewshot = num_fewshot
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight or 2 * batch_size
+        self.share_results = share_results
+        self.tools = functions.get_openai_tools()
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=cpu_workers, thread_name_prefix="batch-cpu")
+        self._ready = queue.Queue()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._preparing = 0
+        self._output = None
+        self.stats = Counter()
+
+    def _submit_prepare(self, session):
+        with self._lock:
+            self._preparing += 1
+        self.executor.submit(self._prepare, session)
+
+    def _prepare(self, session):
+        try:
+            # executor threads don't inherit the caller's context, so label spans per query and turn
+            with self.inference.instrumentation.context(session=session.record_id, iteration=session.depth):
+                if session.prompt is None:
+                    session.prompt = self.inference.build_prompt(session.query, self.tools, self.num_fewshot)
+                session.input_ids = self.inference.tokenize_prompt(session.prompt)
+        except Exception as e:
+            with self._lock:
+                self._preparing -= 1
+            self._finish(session, error=f"Could not prepare prompt: {e}")
+            return
+        # counted and queued together so _next_batch never waits on a session it already holds
+        with self._lock:
+            self._preparing -= 1
+            self._ready.put(session)
+
+    def _admit(self, record_id, query, expected_calls, error=None):
+        with self._lock:
+            self._in_flight += 1
+        session = BatchSession(record_id, query, expected_calls, None)
+        if error is not None:
+            # a bad record gets its error entry instead of stopping the run
+            self._finish(session, error=error)
+            return
+        if self.share_results:
+            session.result_store = ResultStore()
+        # the prompt is rendered on the CPU pool so it overlaps generation
+        self._submit_prepare(session)
+
+    def _process(self, session, completion):
+        try:
+            with self.inference.instrumentation.context(session=session.record_id, iteration=session.depth):
+                assistant_message, tool_calls, tool_message = self.inference.process_turn(
+                    completion, self.chat_template, self.tools, session.query, session.depth, session.result_store, session.tool_session
+                )
+        except Exception as e:
+            self._finish(session, error=str(e))
+            return
+
+        session.prompt.append({"role": "assistant", "content": assistant_message})
+        session.tool_calls.extend(tool_calls or [])
+        if tool_message is None:
+            self._finish(session, answer=assistant_message)
+            return
+
+        session.prompt.append({"role": "tool", "content": tool_message})
+        session.depth += 1
+        if session.depth >= self.max_depth:
+            self._finish(session, answer=assistant_message, error=f"Maximum recursion depth reached ({self.max_depth})")
+            return
+        with self._lock:
+            self._preparing += 1
+        self._prepare(session)
+
+    def _finish(self, session, answer=None, error=None):
+        if session.result_store is not None:
+            session.result_store.close()
+        result = {
+            "id": session.record_id,
+            "query": session.query,
+            "answer": answer,
+            "tool_calls": session.tool_calls,
+            "error": error,
+            "metrics": {
+                "iterations": session.iterations,
+                "generated_tokens": session.generated_tokens,
+                "generation_seconds": round(session.generation_seconds, 4),
+                "latency_seconds": round(time.perf_counter() - session.started, 4),
+            },
+        }
+        if session.expected_calls is not None:
+            result["metrics"].update(score_tool_calls(session.tool_calls, session.expected_calls))
+
+        line = json.dumps(result, default=str)
+        with self._lock:
+            self._output.write(line + "\n")
+            self._output.flush()
+            self._in_flight -= 1
+            self.stats["completed"] += 1
+            self.stats["errors"] += error is not None
+
+    def _next_batch(self):
+        batch = []
+        try:
+            batch.append(self._ready.get(timeout=0.05))
+        except queue.Empty:
+            return batch
+        # prompts admitted together should generate together, so wait briefly for the ones still being prepared
+        deadline = time.monotonic() + BATCH_FILL_SECONDS
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._ready.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            with self._lock:
+                preparing = self._preparing
+            remaining = deadline - time.monotonic()
+            if not preparing or remaining <= 0:
+                break
+            try:
+                batch.append(self._ready.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run(self, input_path, output_path, id_field="id", query_field="query"):
+        completed_ids = read_completed_ids(output_path)
+        if completed_ids:
+            inference_logger.info("Resuming: %d queries already in %s", len(completed_ids), output_path)
+        records = read_records(input_path, id_field, query_field, completed_ids)
+        exhausted = False
+
+        # a crash can leave a partial last line; start appending on a fresh line
+        needs_newline = os.path.exists(output_path) and os.path.getsize(output_path) > 0
+        if needs_newline:
+            with open(output_path, 'rb') as file:
+                file.seek(-1, os.SEEK_END)
+                needs_newline = file.read(1) != b"\n"
+
+        started = time.perf_counter()
+        with open(output_path, 'a') as self._output:
+            if needs_newline:
+                self._output.write("\n")
+            while True:
+                while not exhausted and self._in_flight < self.max_in_flight:
+                    record = next(records, None)
+                    if record is None:
+                        exhausted = True
+                    else:
+                        self._admit(*record)
+
+                with self._lock:
+                    if exhausted and self._in_flight == 0:
+                        break
+
+                batch = self._next_batch()
+                if not batch:
+                    continue
+
+                generate_start = time.perf_counter()
+                # one generate call serves several queries; its spans list all of them
+                with self.inference.instrumentation.context(
+                    session=[session.record_id for session in batch], iteration=[session.depth for session in batch]
+                ):
+                    completions, num_tokens = self.inference.generate_batch([session.input_ids for session in batch])
+                generate_seconds = time.perf_counter() - generate_start
+                self.stats["batches"] += 1
+                self.stats["generated_tokens"] += sum(num_tokens)
+
+                for session, completion, tokens in zip(batch, completions, num_tokens):
+                    session.iterations += 1
+                    session.generated_tokens += tokens
+                    session.generation_seconds += generate_seconds
+                    # parsing and tool calls run while the next batch generates
+                    self.executor.submit(self._process, session, completion)
+
+        elapsed = time.perf_counter() - started
+        self.executor.shutdown(wait=True)
+        return self.summarize(output_path, elapsed)
+
+    def summarize(self, output_path, elapsed):
+        summary = {
+            "completed_this_run": self.stats["completed"],
+            "errors_this_run": self.stats["errors"],
+            "batches": self.stats["batches"],
+            "elapsed_seconds": round(elapsed, 2),
+            "queries_per_second": round(self.stats["completed"] / elapsed, 4) if elapsed else None,
+            "generated_tokens_per_second": round(self.stats["generated_tokens"] / elapsed, 2) if elapsed else None,
+        }
+
+        # accuracy covers every record in the output, including ones from resumed runs
+        scored = exact = 0
+        name_recall = 0.0
+        with open(output_path, 'r') as file:
+            for line in file:
+                try:
+                    metrics = json.loads(line)["metrics"]
+                except (json.JSONDecodeError, KeyError):
+                    continue
+                if "exact_match" in metrics:
+                    scored += 1
+                    exact += metrics["exact_match"]
+                    name_recall += metrics["name_recall"]
+        if scored:
+            summary["scored_queries"] = scored
+            summary["tool_call_exact_match"] = round(exact / scored, 4)
+            summary["tool_call_name_recall"] = round(name_recall / scored, 4)
+        return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the function calling loop over a JSONL file of queries")
+    parser.add_argument("--input", type=str, required=True, help="JSONL file with one query per line")
+    parser.add_argument("--output", type=str, required=True, help="JSONL file results are appended to; rerun with the same path to resume")
+    parser.add_argument("--model_path", type=str, default='NousResearch/Hermes-2-Pro-Llama-3-8B', help="Path to the model folder")
+    parser.add_argument("--chat_template", type=str, default="chatml", help="Chat template for prompt formatting")
+    parser.add_argument("--num_fewshot", type=int, default=None, help="Option to use json mode examples")
+    parser.add_argument("--load_in_4bit", type=str, default="False", help="Option to load in 4bit with bitsandbytes")
+    parser.add_argument("--max_depth", type=int, default=5, help="Maximum number of recursive iteration")
+    parser.add_argument("--batch_size", type=int, default=8, help="Number of conversations generated together")
+    parser.add_argument("--cpu_workers", type=int, default=4, help="Threads for prompt rendering, parsing and tool calls")
+    parser.add_argument("--id_field", type=str, default="id", help="Record field holding the query id (default: line number)")
+    parser.add_argument("--query_field", type=str, default="query", help="Record field holding the query text")
+    parser.add_argument("--disable_result_handles", action="store_true", help="Inline DataFrame results in the prompt instead of sharing them through result handles")
+    parser.add_argument("--metrics_jsonl", type=str, default=None, help="Append per-stage timing and token spans to this JSONL file")
+    parser.add_argument("--metrics_port", type=int, default=None, help="Serve Prometheus metrics for the spans on this port")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    configure_sandbox()
+    instrumentation = build_instrumentation(args.metrics_jsonl, args.metrics_port)
+    inference = ModelInference(args.model_path, args.chat_template, args.load_in_4bit, instrumentation, **model_options(args))
+    runner = BatchRunner(
+        inference, args.chat_template, args.num_fewshot, args.max_depth, args.batch_size,
+        cpu_workers=args.cpu_workers, share_results=not args.disable_result_handles
+    )
+    summary = runner.run(args.input, args.output, args.id_field, args.query_field)
+    inference_logger.info("Batch run summary:\n%s", LogPayload(summary, indent=2, sample_rate=1.0))
+    print(json.dumps(summary, indent=2))
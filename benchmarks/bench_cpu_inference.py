@@ -0,0 +1,145 @@
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_CONFIGS = ["fp32:sdpa", "fp32:eager", "bf16:sdpa", "int8:sdpa", "fp32:sdpa:compile"]
+
+
+def parse_config(config):
+    """precision:attn_implementation[:compile]"""
+    parts = config.split(":")
+    return {
+        "precision": parts[0],
+        "attn_implementation": parts[1] if len(parts) > 1 else "sdpa",
+        "compile_model": len(parts) > 2 and parts[2] == "compile",
+    }
+
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm", 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return None
+
+
+def peak_rss_bytes():
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def build_prompt_ids(tokenizer, query):
+    """the real function calling prompt: system prompt with the full tool catalog plus a user turn"""
+    import functions
+    from prompter import PromptManager
+    from utils import get_chat_template
+
+    if tokenizer.chat_template is None:
+        tokenizer.chat_template = get_chat_template("chatml")
+    chat = [{"role": "user", "content": query}]
+    prompt = PromptManager().generate_prompt(chat, functions.get_openai_tools(), None)
+    return tokenizer.apply_chat_template(prompt, add_generation_prompt=True, return_tensors='pt')
+
+
+def run_config(args, config):
+    """load the model with one configuration and time generation; runs in its own process"""
+    import torch
+    from transformers import AutoTokenizer
+    from model_loader import load_model
+    from instrumentation import FirstTokenTimer
+    from utils import inference_logger
+
+    inference_logger.setLevel("WARNING")
+    options = parse_config(config)
+
+    start = time.perf_counter()
+    model = load_model(args.model_path, device="cpu", num_threads=args.num_threads, **options)
+    load_seconds = time.perf_counter() - start
+    rss_after_load = current_rss_bytes()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model_path)
+    input_ids = build_prompt_ids(tokenizer, args.query)
+    if args.prompt_tokens:
+        input_ids = input_ids[:, -args.prompt_tokens:]
+    generate_kwargs = {
+        "max_new_tokens": args.max_new_tokens,
+        "min_new_tokens": args.max_new_tokens,
+        "do_sample": False,
+        "pad_token_id": tokenizer.eos_token_id,
+        "attention_mask": torch.ones_like(input_ids),
+    }
+
+    # the first call pays for lazy initialization and graph compilation
+    start = time.perf_counter()
+    with torch.inference_mode():
+        model.generate(input_ids, **generate_kwargs)
+    warmup_seconds = time.perf_counter() - start
+
+    prefill, decode_rate = [], []
+    for _ in range(args.runs):
+        timer = FirstTokenTimer()
+        with torch.inference_mode():
+            tokens = model.generate(input_ids, streamer=timer, **generate_kwargs)
+        elapsed = time.perf_counter() - timer.start
+        generated = tokens.shape[1] - input_ids.shape[1]
+        prefill.append(timer.first_token_at - timer.start)
+        decode_rate.append((generated - 1) / (elapsed - prefill[-1]))
+
+    return {
+        "config": config,
+        "threads": torch.get_num_threads(),
+        "prompt_tokens": input_ids.shape[1],
+        "load_seconds": round(load_seconds, 3),
+        "warmup_seconds": round(warmup_seconds, 3),
+        "prefill_seconds": round(statistics.median(prefill), 4),
+        "prefill_tokens_per_second": round(input_ids.shape[1] / statistics.median(prefill), 1),
+        "decode_tokens_per_second": round(statistics.median(decode_rate), 2),
+        "rss_after_load_mb": round(rss_after_load / 2**20, 1) if rss_after_load else None,
+        "peak_rss_mb": round(peak_rss_bytes() / 2**20, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare CPU precision and runtime options for tokens/s and memory")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to a (small) model folder")
+    parser.add_argument("--configs", type=str, nargs="*", default=DEFAULT_CONFIGS, help="precision:attn_implementation[:compile] entries to compare")
+    parser.add_argument("--num_threads", type=int, default=None, help="Torch intra-op threads (default: torch default)")
+    parser.add_argument("--max_new_tokens", type=int, default=64, help="Tokens generated per run")
+    parser.add_argument("--prompt_tokens", type=int, default=None, help="Keep only the last N prompt tokens (default: the full tool prompt)")
+    parser.add_argument("--runs", type=int, default=3, help="Measured runs per configuration")
+    parser.add_argument("--query", type=str, default="I need the current stock price of Tesla (TSLA)")
+    parser.add_argument("--output", type=str, default=None, help="Write results as json to this path")
+    parser.add_argument("--worker", type=str, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_config(args, args.worker)))
+        sys.exit(0)
+
+    # each configuration runs in a fresh process so peak memory is not shared between them
+    results = []
+    forwarded = ["--model_path", args.model_path, "--max_new_tokens", str(args.max_new_tokens), "--runs", str(args.runs), "--query", args.query]
+    if args.num_threads:
+        forwarded += ["--num_threads", str(args.num_threads)]
+    if args.prompt_tokens:
+        forwarded += ["--prompt_tokens", str(args.prompt_tokens)]
+    print(f"{'config':<22}{'load s':>8}{'warmup s':>10}{'prefill tok/s':>15}{'decode tok/s':>14}{'rss MB':>9}{'peak MB':>9}")
+    for config in args.configs:
+        process = subprocess.run([sys.executable, __file__, *forwarded, "--worker", config], capture_output=True, text=True)
+        if process.returncode != 0:
+            print(f"{config:<22}failed: {process.stderr.strip().splitlines()[-1] if process.stderr.strip() else process.returncode}")
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{config:<22}{result['load_seconds']:>8.2f}{result['warmup_seconds']:>10.2f}{result['prefill_tokens_per_second']:>15.1f}"
+              f"{result['decode_tokens_per_second']:>14.2f}{result['rss_after_load_mb']:>9}{result['peak_rss_mb']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({"model_path": args.model_path, "results": results}, file, indent=2)
@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+import numpy as np
+import pandas as pd
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import functions
+from functioncall import ModelInference
+from prompter import PromptManager
+from result_store import ResultStore
+from instrumentation import Instrumentation
+from validator import validate_function_call_schema, validate_json_data
+from utils import get_assistant_message, validate_and_extract_tool_calls, inference_logger
+
+EOS_TOKEN = "<|im_end|>"
+SIZES = {"small": 1, "medium": 10, "large": 100}
+
+
+# ---------------------------------------------------------------------------
+# generated inputs
+
+def make_tool_catalog(num_tools, seed=0):
+    rng = random.Random(seed)
+    types = ["string", "integer", "number", "boolean", "array", "object"]
+    tools = []
+    for i in range(num_tools):
+        properties = {f"arg_{j}": {"type": rng.choice(types), "description": f"argument {j} of tool {i}"} for j in range(rng.randint(1, 8))}
+        properties["mode"] = {"type": "string", "enum": ["fast", "accurate", "balanced"]}
+        tools.append({
+            "type": "function",
+            "function": {
+                "name": f"tool_{i}",
+                "description": f"Synthetic tool number {i} used for benchmarking the validation path.",
+                "parameters": {"type": "object", "properties": properties, "required": list(properties)[:2]},
+            },
+        })
+    return tools
+
+
+def sample_arguments(tool, rng):
+    values = {"string": "TSLA", "integer": 42, "number": 3.14, "boolean": True, "array": [1, 2, 3], "object": {"k": "v"}}
+    arguments = {}
+    for name, schema in tool["function"]["parameters"]["properties"].items():
+        arguments[name] = schema["enum"][0] if "enum" in schema else values[schema["type"]]
+    return arguments
+
+
+def make_tool_calls(catalog, num_calls, seed=0):
+    rng = random.Random(seed)
+    calls = []
+    for _ in range(num_calls):
+        tool = rng.choice(catalog)
+        calls.append({"name": tool["function"]["name"], "arguments": sample_arguments(tool, rng)})
+    return calls
+
+
+def make_assistant_message(tool_calls):
+    parts = ["<scratch_pad>\nGoal: benchmark the parser\n</scratch_pad>"]
+    parts.extend(f"<tool_call>\n{json.dumps(call)}\n</tool_call>" for call in tool_calls)
+    return "\n".join(parts)
+
+
+def make_transcript(num_turns, catalog, seed=0):
+    """chatml completion text with num_turns of assistant tool calls and tool responses"""
+    rng = random.Random(seed)
+    parts = [f"<|im_start|>system\nYou are a function calling AI model.<tools>{json.dumps(catalog)}</tools>{EOS_TOKEN}"]
+    parts.append(f"<|im_start|>user\nAnalyse TSLA for me{EOS_TOKEN}")
+    for turn in range(num_turns):
+        calls = make_tool_calls(catalog, 2, seed=seed + turn)
+        parts.append(f"<|im_start|>assistant\n{make_assistant_message(calls)}{EOS_TOKEN}")
+        content = json.dumps({"rows": [[rng.random() for _ in range(8)] for _ in range(20)]})
+        parts.append(f"<|im_start|>tool\n<tool_response>\n{content}\n</tool_response>{EOS_TOKEN}")
+    parts.append(f"<|im_start|>assistant\n{make_assistant_message(make_tool_calls(catalog, 3, seed=seed))}{EOS_TOKEN}")
+    return "\n".join(parts)
+
+
+def make_json_document(num_items, seed=0):
+    rng = random.Random(seed)
+    schema = {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "items": {"type": "array", "items": {
+                "type": "object",
+                "properties": {"id": {"type": "integer"}, "price": {"type": "number"}, "tags": {"type": "array", "items": {"type": "string"}}},
+                "required": ["id", "price"],
+            }},
+        },
+        "required": ["name", "items"],
+    }
+    document = {"name": "portfolio", "items": [{"id": i, "price": rng.random() * 100, "tags": ["a", "b"]} for i in range(num_items)]}
+    return json.dumps(document), schema
+
+
+def make_frame(num_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2000-01-01", periods=num_rows, freq="D", name="Date")
+    columns = ["Open", "High", "Low", "Close", "Volume", "Dividends", "Stock Splits"]
+    return pd.DataFrame(rng.random((num_rows, len(columns))) * 100, index=index, columns=columns)
+
+
+# ---------------------------------------------------------------------------
+# scripted fake model for the end-to-end loop
+
+class ScriptedTokenizer:
+    """renders chatml as text and hands the scripted model's next reply back through decode"""
+
+    eos_token = EOS_TOKEN
+    eos_token_id = 0
+    pad_token_id = 0
+
+    def __init__(self, replies):
+        self.replies = replies
+        self.turn = 0
+        self.rendered = ""
+
+    def apply_chat_template(self, messages, add_generation_prompt=True, tokenize=True, **kwargs):
+        self.rendered = "".join(f"<|im_start|>{m['role']}\n{m['content']}{EOS_TOKEN}\n" for m in messages)
+        if add_generation_prompt:
+            self.rendered += "<|im_start|>assistant\n"
+        return self(self.rendered)["input_ids"][0].tolist() if tokenize else self.rendered
+
+    def __call__(self, text, **kwargs):
+        # one fake id per 4 characters, roughly what a real tokenizer produces
+        return {"input_ids": torch.zeros((1, max(len(text) // 4, 1)), dtype=torch.long)}
+
+    def decode(self, tokens, **kwargs):
+        reply = self.replies[min(self.turn, len(self.replies) - 1)]
+        self.turn += 1
+        return f"{self.rendered}{reply}{EOS_TOKEN}"
+
+
+class ScriptedModel:
+    device = "cpu"
+    dtype = torch.float32
+    config = None
+
+    def generate(self, input_ids, num_return_sequences=1, **kwargs):
+        return input_ids.repeat(num_return_sequences, 1)
+
+
+def make_scripted_inference(replies):
+    inference = object.__new__(ModelInference)
+    inference.prompter = PromptManager()
+    inference.tokenizer = ScriptedTokenizer(replies)
+    inference.model = ScriptedModel()
+    inference.generation_kwargs = {}
+    inference.instrumentation = Instrumentation()
+    inference.completion_cache = None
+    inference.speculative = None
+    return inference
+
+
+# ---------------------------------------------------------------------------
+# benchmarks
+
+def bench_get_assistant_message(scale):
+    catalog = make_tool_catalog(20)
+    completion = make_transcript(5 * scale, catalog)
+    return lambda: get_assistant_message(completion, "chatml", EOS_TOKEN)
+
+
+def bench_validate_and_extract_tool_calls(scale):
+    message = make_assistant_message(make_tool_calls(make_tool_catalog(20), 2 * scale))
+    return lambda: validate_and_extract_tool_calls(message)
+
+
+def bench_validate_function_call_schema(scale):
+    catalog = make_tool_catalog(10 * scale)
+    # worst case: the called tool is the last one in the catalog
+    call = make_tool_calls(catalog[-1:], 1)[0]
+    return lambda: validate_function_call_schema(call, catalog)
+
+
+def bench_validate_json_data(scale):
+    document, schema = make_json_document(50 * scale)
+    return lambda: validate_json_data(document, schema)
+
+
+def bench_generate_prompt(scale):
+    prompter = PromptManager()
+    catalog = make_tool_catalog(10 * scale)
+    chat = [{"role": "user", "content": "Analyse TSLA for me"}]
+    return lambda: prompter.generate_prompt(chat, catalog, num_fewshot=None)
+
+
+def bench_get_openai_tools(scale):
+    return lambda: [functions.get_openai_tools() for _ in range(scale)]
+
+
+def bench_execute_function_call(scale):
+    frame = make_frame(1000 * scale)
+    functions._bench_frame_tool = lambda *args: frame
+    inference = make_scripted_inference([""])
+    call = {"name": "_bench_frame_tool", "arguments": {"symbol": "TSLA"}}
+    return lambda: inference.execute_function_call(call)
+
+
+def bench_execute_function_call_shared(scale):
+    frame = make_frame(1000 * scale)
+    functions._bench_frame_tool = lambda *args: frame
+    inference = make_scripted_inference([""])
+    call = {"name": "_bench_frame_tool", "arguments": {"symbol": "TSLA"}}
+
+    def run():
+        with ResultStore() as store:
+            inference.execute_function_call(call, store)
+    return run
+
+
+def bench_agent_loop(scale):
+    """full generate_function_call with a scripted model: scale tool-calling turns, then a final answer"""
+    frame = make_frame(200)
+    functions._bench_frame_tool = lambda symbol: frame
+    bench_tool = {"type": "function", "function": {
+        "name": "_bench_frame_tool", "description": "Return price history.",
+        "parameters": {"type": "object", "properties": {"symbol": {"type": "string"}}, "required": ["symbol"]},
+    }}
+    catalog = make_tool_catalog(20) + [bench_tool]
+    call = json.dumps({"name": "_bench_frame_tool", "arguments": {"symbol": "TSLA"}})
+    replies = [f"<tool_call>\n{call}\n</tool_call>"] * scale + ["TSLA closed higher over the period."]
+    original_get_openai_tools = functions.get_openai_tools
+
+    def run():
+        functions.get_openai_tools = lambda: catalog
+        try:
+            inference = make_scripted_inference(replies)
+            inference.generate_function_call("Analyse TSLA", "chatml", None, max_depth=scale + 1, share_results=False)
+        finally:
+            functions.get_openai_tools = original_get_openai_tools
+    return run
+
+
+BENCHMARKS = {
+    "get_assistant_message": bench_get_assistant_message,
+    "validate_and_extract_tool_calls": bench_validate_and_extract_tool_calls,
+    "validate_function_call_schema": bench_validate_function_call_schema,
+    "validate_json_data": bench_validate_json_data,
+    "generate_prompt": bench_generate_prompt,
+    "get_openai_tools": bench_get_openai_tools,
+    "execute_function_call": bench_execute_function_call,
+    "execute_function_call_shared": bench_execute_function_call_shared,
+    "agent_loop": bench_agent_loop,
+}
+
+
+def measure(run, min_time, max_runs):
+    run()  # warm up caches and lazy imports
+    timings = []
+    deadline = time.perf_counter() + min_time
+    while len(timings) < 3 or (time.perf_counter() < deadline and len(timings) < max_runs):
+        start = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - start)
+    return {
+        "runs": len(timings),
+        "median_ms": statistics.median(timings) * 1000,
+        "min_ms": min(timings) * 1000,
+    }
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for key, stats in results.items():
+        if key in baseline:
+            ratio = stats["median_ms"] / baseline[key]["median_ms"]
+            if ratio > 1 + threshold:
+                regressions.append((key, baseline[key]["median_ms"], stats["median_ms"], ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the CPU-side hot paths of the function calling loop")
+    parser.add_argument("--only", type=str, nargs="*", default=None, help="Benchmarks to run (default: all)")
+    parser.add_argument("--sizes", type=str, nargs="*", default=list(SIZES), choices=list(SIZES), help="Input sizes to run")
+    parser.add_argument("--min_time", type=float, default=0.5, help="Minimum seconds spent measuring each case")
+    parser.add_argument("--max_runs", type=int, default=200, help="Maximum measured runs per case")
+    parser.add_argument("--output", type=str, default=None, help="Write results as json to this path")
+    parser.add_argument("--baseline", type=str, default=None, help="Results json from an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown reported as a regression")
+    parser.add_argument("--log_level", type=str, default="WARNING", help="Level for inference_logger while benchmarking")
+    args = parser.parse_args()
+
+    inference_logger.setLevel(args.log_level)
+
+    results = {}
+    for name, make_case in BENCHMARKS.items():
+        if args.only and name not in args.only:
+            continue
+        for size in args.sizes:
+            key = f"{name}[{size}]"
+            results[key] = measure(make_case(SIZES[size]), args.min_time, args.max_runs)
+            print(f"{key:<48}{results[key]['median_ms']:>12.3f} ms  (min {results[key]['min_ms']:.3f}, runs {results[key]['runs']})")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({"python": sys.version.split()[0], "results": results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for key, before, after, ratio in regressions:
+            print(f"REGRESSION {key}: {before:.3f} ms -> {after:.3f} ms ({ratio:.2f}x)")
+        sys.exit(1 if regressions else 0)
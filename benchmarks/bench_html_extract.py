@@ -0,0 +1,99 @@
+import os
+import re
+import sys
+import json
+import time
+import random
+import argparse
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from html_extract import extract_page_content, etree
+
+
+def legacy_extract(html):
+    """the whole-document BeautifulSoup extraction google_search_and_scrape used before html_extract"""
+    soup = BeautifulSoup(html, 'html.parser')
+    paragraphs = [p.text.strip() for p in soup.find_all('p') if p.text.strip()]
+    text_content = ' '.join(paragraphs)
+    text_content = re.sub(r'\s+', ' ', text_content)
+    table_data = [[cell.get_text(strip=True) for cell in row.find_all('td')] for table in soup.find_all('table') for row in table.find_all('tr')]
+    return {'content': text_content, 'tables': table_data}
+
+
+def synthetic_page(num_paragraphs, num_rows, seed):
+    """news-style page with navigation, scripts, repeated boilerplate and a data table"""
+    rng = random.Random(seed)
+    words = ["market", "shares", "revenue", "quarter", "growth", "analyst", "guidance", "margin",
+             "investors", "earnings", "outlook", "deliveries", "forecast", "demand", "supply"]
+    boilerplate = "<p>Subscribe to our newsletter to get the latest market news delivered daily.</p>"
+    parts = ["<html><head><title>page</title>",
+             "<script>" + "var tracking = {};" * 200 + "</script>",
+             "<style>" + ".c{color:red}" * 200 + "</style></head><body>",
+             "<nav><ul>" + "<li><a href='#'>Section</a></li>" * 50 + "</ul></nav>"]
+    for i in range(num_paragraphs):
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(20, 60)))
+        parts.append(f"<div class='article'><p>{sentence.capitalize()}.</p></div>")
+        if i % 10 == 0:
+            parts.append(boilerplate)
+    parts.append("<table>")
+    for i in range(num_rows):
+        parts.append(f"<tr><td>2024-01-{i % 28 + 1:02d}</td><td>{rng.uniform(100, 300):.2f}</td><td>{rng.randint(10**6, 10**8)}</td></tr>")
+    parts.append("</table><footer><p>Copyright and terms of use for this website.</p></footer></body></html>")
+    return "".join(parts)
+
+
+def load_corpus(corpus_dir):
+    pages = []
+    for name in sorted(os.listdir(corpus_dir)):
+        if name.endswith((".html", ".htm")):
+            with open(os.path.join(corpus_dir, name), 'r', encoding='utf-8', errors='replace') as file:
+                pages.append((name, file.read()))
+    return pages
+
+
+def generate_corpus():
+    sizes = [(20, 10), (200, 100), (1000, 500), (5000, 2000)]
+    return [(f"synthetic_{p}p_{r}r.html", synthetic_page(p, r, seed=i)) for i, (p, r) in enumerate(sizes)]
+
+
+def measure(extract, pages, repeat):
+    stats = {"seconds": 0.0, "input_bytes": 0, "output_chars": 0}
+    for _ in range(repeat):
+        for _, html in pages:
+            start = time.perf_counter()
+            result = extract(html)
+            stats["seconds"] += time.perf_counter() - start
+            stats["input_bytes"] += len(html)
+            stats["output_chars"] += len(json.dumps(result))
+    stats["pages_per_s"] = len(pages) * repeat / stats["seconds"]
+    stats["mb_per_s"] = stats["input_bytes"] / stats["seconds"] / 1e6
+    stats["output_chars_per_page"] = stats["output_chars"] / (len(pages) * repeat)
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare html_extract against the legacy BeautifulSoup scraper")
+    parser.add_argument("--corpus_dir", type=str, default=None, help="Folder of saved .html pages (default: generated synthetic pages)")
+    parser.add_argument("--max_chars", type=int, default=4000, help="Character budget passed to extract_page_content")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of passes over the corpus")
+    parser.add_argument("--output", type=str, default=None, help="Optional path for a json results file")
+    args = parser.parse_args()
+
+    pages = load_corpus(args.corpus_dir) if args.corpus_dir else generate_corpus()
+    extractors = {"legacy_bs4": legacy_extract}
+    if etree is not None:
+        extractors["html_extract_lxml"] = lambda html: extract_page_content(html, max_chars=args.max_chars)
+    extractors["html_extract_stdlib"] = lambda html: extract_page_content(html, max_chars=args.max_chars, use_lxml=False)
+    extractors["html_extract_stdlib_unbounded"] = lambda html: extract_page_content(html, max_chars=sys.maxsize, use_lxml=False)
+
+    results = {name: measure(extract, pages, args.repeat) for name, extract in extractors.items()}
+    print(f"{len(pages)} pages, {sum(len(html) for _, html in pages) / 1e6:.2f} MB per pass")
+    print(f"{'extractor':<32}{'pages/s':>10}{'MB/s':>10}{'chars/page':>12}")
+    for name, stats in results.items():
+        print(f"{name:<32}{stats['pages_per_s']:>10.1f}{stats['mb_per_s']:>10.2f}{stats['output_chars_per_page']:>12.0f}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
@@ -0,0 +1,138 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MODES = ["off", "prompt_lookup", "draft"]
+
+# conversations that stop where the model writes its next turn: a first tool call,
+# a call after a tool response, and parallel calls
+DEFAULT_TRANSCRIPTS = [
+    {"query": "I need the current stock price of Tesla (TSLA)", "messages": []},
+    {
+        "query": "What are the fundamentals of Apple and its analyst recommendations?",
+        "messages": [
+            {"role": "assistant", "content": '<tool_call>\n{"arguments": {"symbol": "AAPL"}, "name": "get_stock_fundamentals"}\n</tool_call>'},
+            {"role": "tool", "content": '<tool_response>\n{"name": "get_stock_fundamentals", "content": {"symbol": "AAPL", "company_name": "Apple Inc.", "sector": "Technology", "industry": "Consumer Electronics", "market_cap": 2911544311808, "pe_ratio": 28.46, "pb_ratio": 39.8, "dividend_yield": 0.0052, "eps": 6.42, "beta": 1.26, "52_week_high": 199.62, "52_week_low": 164.08}}\n</tool_response>'},
+        ],
+    },
+    {
+        "query": "Compare the dividend data and technical indicators of Microsoft and Nvidia",
+        "messages": [
+            {"role": "assistant", "content": '<tool_call>\n{"arguments": {"symbol": "MSFT"}, "name": "get_dividend_data"}\n</tool_call>\n<tool_call>\n{"arguments": {"symbol": "NVDA"}, "name": "get_dividend_data"}\n</tool_call>'},
+            {"role": "tool", "content": '<tool_response>\n{"name": "get_dividend_data", "content": {"symbol": "MSFT", "dividends": [0.68, 0.75, 0.75, 0.75]}}\n</tool_response>\n<tool_response>\n{"name": "get_dividend_data", "content": {"symbol": "NVDA", "dividends": [0.04, 0.04, 0.04, 0.01]}}\n</tool_response>'},
+        ],
+    },
+]
+
+
+def read_transcripts(path):
+    """JSONL of {query, messages} records; messages continue the conversation after the first user turn"""
+    with open(path, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def build_prompts(inference, transcripts):
+    import functions
+
+    tools = functions.get_openai_tools()
+    return [inference.build_prompt(transcript["query"], tools) + transcript["messages"] for transcript in transcripts]
+
+
+def run_mode(inference, sink, prompts, speculative, runs):
+    """generate every prompt runs times; returns seconds, generated tokens and completions per prompt"""
+    inference.speculative = speculative
+    seconds, tokens, completions = [], [], []
+    for prompt in prompts:
+        elapsed = []
+        for _ in range(runs):
+            del sink.spans[:]
+            start = time.perf_counter()
+            completion = inference.run_inference(prompt)
+            elapsed.append(time.perf_counter() - start)
+        seconds.append(statistics.median(elapsed))
+        tokens.append(sum(span["generated_tokens"] for span in sink.spans if span["span"] == "generate"))
+        completions.append(completion)
+    return seconds, tokens, completions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure speculative decoding speedup and draft acceptance on tool calling transcripts")
+    parser.add_argument("--model_path", type=str, required=True, help="Path to the main model folder")
+    parser.add_argument("--draft_model_path", type=str, default=None, help="Draft model sharing the tokenizer of the main model (needed for the draft mode)")
+    parser.add_argument("--modes", type=str, nargs="*", default=None, choices=MODES, help="Modes to compare (default: off, prompt_lookup and draft when a draft model is given)")
+    parser.add_argument("--transcripts", type=str, default=None, help="JSONL of {query, messages} records (default: built-in tool calling transcripts)")
+    parser.add_argument("--num_threads", type=int, default=None, help="Torch intra-op threads (default: torch default)")
+    parser.add_argument("--max_new_tokens", type=int, default=128, help="Tokens generated per completion")
+    parser.add_argument("--num_draft_tokens", type=int, default=5, help="Tokens the draft model proposes per step to start with")
+    parser.add_argument("--prompt_lookup_num_tokens", type=int, default=10, help="Tokens copied from the prompt per step")
+    parser.add_argument("--runs", type=int, default=3, help="Measured runs per transcript and mode")
+    parser.add_argument("--output", type=str, default=None, help="Write results as json to this path")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 when a mode's greedy output differs from plain decoding")
+    args = parser.parse_args()
+
+    from functioncall import ModelInference
+    from model_loader import load_model
+    from speculative import SpeculativeDecoder
+    from instrumentation import Instrumentation, InMemorySink
+    from utils import inference_logger
+
+    inference_logger.setLevel("WARNING")
+    modes = args.modes or (MODES if args.draft_model_path else MODES[:2])
+    sink = InMemorySink()
+    inference = ModelInference(args.model_path, "chatml", instrumentation=Instrumentation([sink]), device="cpu", num_threads=args.num_threads)
+    # greedy decoding, so every mode has to produce the same completion
+    inference.generation_kwargs = {"max_new_tokens": args.max_new_tokens, "do_sample": False, "repetition_penalty": 1.1}
+    draft_model = load_model(args.draft_model_path, device="cpu", num_threads=args.num_threads) if "draft" in modes else None
+
+    prompts = build_prompts(inference, read_transcripts(args.transcripts) if args.transcripts else DEFAULT_TRANSCRIPTS)
+    # the first call pays for lazy initialization
+    inference.run_inference(prompts[0])
+
+    results = []
+    baseline = None
+    print(f"{'mode':<16}{'seconds':>10}{'tok/s':>9}{'speedup':>9}{'acceptance':>12}{'tok/step':>10}{'same output':>13}")
+    for mode in modes:
+        speculative = None
+        if mode != "off":
+            speculative = SpeculativeDecoder(
+                inference.model, mode, draft_model if mode == "draft" else None,
+                num_draft_tokens=args.num_draft_tokens, prompt_lookup_num_tokens=args.prompt_lookup_num_tokens,
+            )
+        seconds, tokens, completions = run_mode(inference, sink, prompts, speculative, args.runs)
+        stats = speculative.stats() if speculative else {}
+        if speculative:
+            speculative.close()
+
+        total_seconds = sum(seconds)
+        if baseline is None:
+            baseline = {"seconds": total_seconds, "completions": completions}
+        result = {
+            "mode": mode,
+            "seconds": round(total_seconds, 3),
+            "generated_tokens": sum(tokens),
+            "tokens_per_second": round(sum(tokens) / total_seconds, 2),
+            "speedup": round(baseline["seconds"] / total_seconds, 3),
+            "acceptance_rate": stats.get("acceptance_rate"),
+            "tokens_per_step": stats.get("tokens_per_step"),
+            "same_output": completions == baseline["completions"],
+            "per_transcript_seconds": [round(value, 4) for value in seconds],
+        }
+        results.append(result)
+        acceptance = f"{result['acceptance_rate']:.3f}" if result["acceptance_rate"] is not None else "-"
+        per_step = f"{result['tokens_per_step']:.2f}" if result["tokens_per_step"] is not None else "-"
+        print(f"{mode:<16}{result['seconds']:>10.2f}{result['tokens_per_second']:>9.1f}{result['speedup']:>9.2f}"
+              f"{acceptance:>12}{per_step:>10}{str(result['same_output']):>13}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({"model_path": args.model_path, "draft_model_path": args.draft_model_path, "results": results}, file, indent=2)
+
+    mismatched = [result["mode"] for result in results if not result["same_output"]]
+    if args.check and mismatched:
+        print(f"greedy output differs from plain decoding with: {', '.join(mismatched)}")
+        sys.exit(1)
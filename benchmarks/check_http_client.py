@@ -0,0 +1,133 @@
+import os
+import sys
+import time
+import argparse
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests
+
+from http_client import HTTPClient, ResponseTooLarge
+
+
+class PageHandler(BaseHTTPRequestHandler):
+    """local pages for each HTTPClient behavior: plain, slow to answer, slow to stream, large and failing"""
+    protocol_version = "HTTP/1.1"
+    hits = {}
+    connections = set()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, body, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        self.hits[self.path] = self.hits.get(self.path, 0) + 1
+        self.connections.add(self.client_address)
+        if path == "/page":
+            self.send_body(f"<p>page {self.path}</p>".encode())
+        elif path == "/slow":
+            time.sleep(self.server.delay)
+            self.send_body(b"<p>slow</p>")
+        elif path == "/trickle":
+            # every chunk arrives inside the read timeout but the whole body misses the deadline
+            self.send_response(200)
+            self.send_header("Content-Length", str(1024 * 64))
+            self.end_headers()
+            for _ in range(64):
+                self.wfile.write(b"x" * 1024)
+                self.wfile.flush()
+                time.sleep(self.server.delay / 8)
+        elif path == "/large":
+            self.send_body(b"y" * self.server.large_bytes)
+        else:
+            self.send_body(b"failed", status=500)
+
+
+class PageServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # the client hangs up on slow and oversized pages on purpose
+        pass
+
+
+def expect_error(error_type, function, *args, **kwargs):
+    try:
+        function(*args, **kwargs)
+    except error_type as e:
+        return e
+    return None
+
+
+def run_checks(base_url, delay, max_bytes):
+    results = {}
+    client = HTTPClient(connect_timeout=1, read_timeout=delay / 2, total_timeout=delay, max_bytes=max_bytes, cache_ttl=delay)
+
+    first = client.get_text(f"{base_url}/page", params={"b": 2, "a": 1})
+    second = client.get_text(f"{base_url}/page", params={"a": 1, "b": 2})
+    results["cache hit on reordered params"] = first == second and PageHandler.hits.get("/page?a=1&b=2", 0) + PageHandler.hits.get("/page?b=2&a=1", 0) == 1
+
+    time.sleep(delay + 0.1)
+    client.get_text(f"{base_url}/page", params={"a": 1, "b": 2})
+    results["cache entry expires after cache_ttl"] = PageHandler.hits.get("/page?b=2&a=1", 0) + PageHandler.hits.get("/page?a=1&b=2", 0) == 2
+
+    results["errors are not cached"] = (expect_error(requests.HTTPError, client.get_text, f"{base_url}/missing") is not None
+                                        and expect_error(requests.HTTPError, client.get_text, f"{base_url}/missing") is not None
+                                        and PageHandler.hits.get("/missing") == 2)
+
+    start = time.monotonic()
+    results["read timeout"] = expect_error(requests.Timeout, client.get_text, f"{base_url}/slow") is not None and time.monotonic() - start < delay
+
+    start = time.monotonic()
+    results["total deadline"] = expect_error(requests.Timeout, client.get_text, f"{base_url}/trickle") is not None and time.monotonic() - start < 2 * delay
+
+    text = client.get_text(f"{base_url}/large")
+    results["byte cap truncates"] = len(text) == max_bytes
+    client.clear_cache()
+    results["byte cap raises without truncate"] = expect_error(ResponseTooLarge, client.get_text, f"{base_url}/large", truncate=False) is not None
+
+    PageHandler.connections.clear()
+    urls = [f"{base_url}/page?n={index}" for index in range(20)]
+    fetched = dict(client.fetch_many(urls + [f"{base_url}/missing"]))
+    results["fetch_many yields every url"] = all(fetched[url] for url in urls) and fetched[f"{base_url}/missing"] is None
+    results["connections are reused"] = len(PageHandler.connections) < len(urls)
+
+    client.close()
+
+    client = HTTPClient(max_bytes=max_bytes, cache_ttl=60, cache_max_bytes=2 * max_bytes)
+    for index in range(4):
+        client.get_text(f"{base_url}/large?n={index}")
+    client.get_text(f"{base_url}/large?n=3")
+    client.get_text(f"{base_url}/large?n=0")
+    results["cache bounded by bytes"] = (client._cache_bytes <= 2 * max_bytes
+                                         and PageHandler.hits["/large?n=3"] == 1 and PageHandler.hits["/large?n=0"] == 2)
+    client.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check HTTPClient caching, timeouts and the byte caps against a local http.server")
+    parser.add_argument("--delay", type=float, default=1.0, help="Seconds the slow pages take; timeouts and cache ttl scale with it")
+    parser.add_argument("--max_bytes", type=int, default=256 * 1024, help="Response cap given to the client")
+    args = parser.parse_args()
+
+    server = PageServer(("127.0.0.1", 0), PageHandler)
+    server.delay = args.delay
+    server.large_bytes = 4 * args.max_bytes
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    results = run_checks(f"http://127.0.0.1:{server.server_port}", args.delay, args.max_bytes)
+    server.shutdown()
+    for name, passed in results.items():
+        print(f"{name:<40}{'ok' if passed else 'FAILED'}")
+    sys.exit(0 if all(results.values()) else 1)
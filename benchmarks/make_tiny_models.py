@@ -0,0 +1,50 @@
+import os
+import argparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# llama shapes of the two randomly initialized test models; "draft" shares the tokenizer of "main"
+MODEL_SHAPES = {
+    "draft": dict(hidden_size=64, intermediate_size=128, num_hidden_layers=2, num_attention_heads=4, num_key_value_heads=2),
+    "main": dict(hidden_size=256, intermediate_size=768, num_hidden_layers=6, num_attention_heads=8, num_key_value_heads=4),
+}
+
+
+def train_tokenizer(vocab_size):
+    """byte-level BPE with the chatml special tokens, trained on the repo's README and tool definitions"""
+    from tokenizers import Tokenizer, models, trainers, pre_tokenizers, decoders
+    from transformers import PreTrainedTokenizerFast
+
+    lines = []
+    for name in ("README.md", "functions.py"):
+        with open(os.path.join(ROOT, name), 'r') as file:
+            lines.extend(file.read().splitlines())
+
+    tokenizer = Tokenizer(models.BPE())
+    tokenizer.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tokenizer.decoder = decoders.ByteLevel()
+    trainer = trainers.BpeTrainer(vocab_size=vocab_size, special_tokens=["<|im_start|>", "<|im_end|>", "<unk>"],
+                                  initial_alphabet=pre_tokenizers.ByteLevel.alphabet())
+    tokenizer.train_from_iterator(lines, trainer)
+    return PreTrainedTokenizerFast(tokenizer_object=tokenizer, bos_token="<|im_start|>", eos_token="<|im_end|>", unk_token="<unk>")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the tiny main/draft model pair used by the benchmarks")
+    parser.add_argument("--output_dir", type=str, default="tiny-models", help="Folder for the main and draft model folders")
+    parser.add_argument("--vocab_size", type=int, default=2000, help="Tokenizer vocabulary size")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random weights")
+    args = parser.parse_args()
+
+    import torch
+    from transformers import LlamaConfig, LlamaForCausalLM
+
+    tokenizer = train_tokenizer(args.vocab_size)
+    for name, shape in MODEL_SHAPES.items():
+        torch.manual_seed(args.seed)
+        config = LlamaConfig(vocab_size=len(tokenizer), max_position_embeddings=4096,
+                             bos_token_id=tokenizer.bos_token_id, eos_token_id=tokenizer.eos_token_id, **shape)
+        path = os.path.join(args.output_dir, name)
+        LlamaForCausalLM(config).save_pretrained(path, safe_serialization=True)
+        tokenizer.save_pretrained(path)
+        print(f"{name}: {path}")
@@ -0,0 +1,168 @@
+import os
+import json
+import time
+import array
+import sqlite3
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from utils import inference_logger
+
+CACHE_MODES = ["off", "deterministic", "always"]
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "completion_cache", "completions.sqlite")
+
+
+class CompletionCache:
+    """
+    Exact-match cache of completions keyed by model, generation settings and prompt token ids.
+
+    Lookups go to an in-memory LRU first and then to an sqlite file, so repeated prompts
+    are served across processes and restarts. Disk entries expire after ttl seconds and
+    the least recently used ones are evicted once the file holds more than max_disk_bytes.
+
+    Args:
+        mode (str): "deterministic" caches only greedy decoding; "always" also caches
+            sampled completions, for replaying identical prompts; "off" disables lookups.
+        memory_entries (int): Size of the in-memory LRU.
+        disk_path (str): sqlite file for the disk tier, or None for memory only.
+        ttl (float): Seconds a disk entry stays valid.
+        max_disk_bytes (int): Size limit for the cached completions on disk.
+    """
+
+    def __init__(self, mode="deterministic", memory_entries=1024, disk_path=DEFAULT_CACHE_PATH,
+                 ttl=7 * 24 * 3600, max_disk_bytes=512 * 1024 * 1024):
+        self.mode = mode
+        self.memory_entries = memory_entries
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = {"memory": 0, "disk": 0}
+        self.misses = 0
+        self._db = None
+        if disk_path:
+            os.makedirs(os.path.dirname(os.path.abspath(disk_path)), exist_ok=True)
+            self._db = sqlite3.connect(disk_path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS completions ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS completions_accessed ON completions (accessed)")
+            self._db.execute("DELETE FROM completions WHERE created < ?", (time.time() - ttl,))
+
+    def enabled_for(self, generation_kwargs):
+        if self.mode == "always":
+            return True
+        return self.mode == "deterministic" and not generation_kwargs.get("do_sample", False)
+
+    @staticmethod
+    def key(model, generation_kwargs, input_ids, num_candidates=1):
+        """sha256 over the model id and load options, the generation settings and the prompt token ids"""
+        settings = {
+            "model": getattr(model.config, "_name_or_path", None),
+            "dtype": str(getattr(model, "dtype", None)),
+            # precision (int8, 4bit, ...), attention kernel and compile flag from load_model
+            "load_options": getattr(model, "load_options", None),
+            "generation": generation_kwargs,
+            "num_candidates": num_candidates,
+        }
+        digest = hashlib.sha256(json.dumps(settings, sort_keys=True, default=str).encode())
+        digest.update(array.array("q", input_ids).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits["memory"] += 1
+                return self._memory[key]
+            if self._db is not None:
+                now = time.time()
+                row = self._db.execute("SELECT value, created FROM completions WHERE key = ?", (key,)).fetchone()
+                if row is not None and row[1] >= now - self.ttl:
+                    self._db.execute("UPDATE completions SET accessed = ? WHERE key = ?", (now, key))
+                    completions = json.loads(row[0])
+                    self._remember(key, completions)
+                    self.hits["disk"] += 1
+                    return completions
+                if row is not None:
+                    self._db.execute("DELETE FROM completions WHERE key = ?", (key,))
+            self.misses += 1
+            return None
+
+    def put(self, key, completions):
+        with self._lock:
+            self._remember(key, completions)
+            if self._db is None:
+                return
+            value = json.dumps(completions)
+            now = time.time()
+            self._db.execute(
+                "INSERT OR REPLACE INTO completions (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value), now, now),
+            )
+            self._evict_disk()
+
+    def _remember(self, key, completions):
+        self._memory[key] = completions
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self):
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM completions").fetchone()
+        if total <= self.max_disk_bytes:
+            return
+        # drop least recently used entries until the store is back under 90% of the limit
+        excess = total - int(self.max_disk_bytes * 0.9)
+        freed = 0
+        stale = []
+        for key, size in self._db.execute("SELECT key, size FROM completions ORDER BY accessed"):
+            stale.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._db.executemany("DELETE FROM completions WHERE key = ?", stale)
+
+    def stats(self):
+        lookups = self.hits["memory"] + self.hits["disk"] + self.misses
+        return {
+            "lookups": lookups,
+            "memory_hits": self.hits["memory"],
+            "disk_hits": self.hits["disk"],
+            "misses": self.misses,
+            "hit_rate": round((lookups - self.misses) / lookups, 4) if lookups else None,
+        }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def add_cache_arguments(parser):
+    """command line options for the completion cache shared by the inference scripts"""
+    parser.add_argument("--cache", type=str, default="off", choices=CACHE_MODES, help="Completion cache: off, deterministic (greedy decoding only) or always (also sampled completions)")
+    parser.add_argument("--cache_path", type=str, default=DEFAULT_CACHE_PATH, help="sqlite file backing the completion cache")
+    parser.add_argument("--cache_ttl", type=float, default=7 * 24 * 3600, help="Seconds a cached completion stays valid on disk")
+    parser.add_argument("--cache_max_mb", type=int, default=512, help="Size limit of the on-disk completion cache in MB")
+    parser.add_argument("--greedy", action="store_true", help="Decode greedily instead of sampling; makes completions deterministic and cacheable")
+    return parser
+
+
+def setup_completion_cache(inference, args):
+    """apply --greedy and attach a CompletionCache built from add_cache_arguments options"""
+    if args.greedy:
+        inference.generation_kwargs["do_sample"] = False
+        inference.generation_kwargs.pop("temperature", None)
+    if args.cache == "off":
+        return None
+    cache = CompletionCache(args.cache, disk_path=args.cache_path, ttl=args.cache_ttl, max_disk_bytes=args.cache_max_mb * 1024 * 1024)
+    if not cache.enabled_for(inference.generation_kwargs):
+        inference_logger.warning("Completion cache is in deterministic mode but decoding samples; pass --greedy or --cache always")
+    inference.completion_cache = cache
+    return cache
@@ -0,0 +1,208 @@
+import os
+import sys
+import json
+import socket
+import logging
+import signal
+import argparse
+import tempfile
+import threading
+import socketserver
+
+MODES = ["function_call", "json"]
+
+# clients import this module, so it stays free of the model and logging setup
+inference_logger = logging.getLogger("function-calling-inference")
+
+
+class DaemonError(Exception):
+    pass
+
+
+def default_socket_path(mode):
+    socket_dir = os.environ.get("HFC_DAEMON_DIR", tempfile.gettempdir())
+    return os.path.join(socket_dir, f"hermes-{mode}.sock")
+
+
+def request_daemon(mode, request, on_event, socket_path=None):
+    """
+    Send a query to a running daemon and pass each streamed event to on_event.
+
+    Returns False when no daemon is listening, so the caller can run in-process.
+    Raises DaemonError when the daemon reports an error.
+    """
+    socket_path = socket_path or default_socket_path(mode)
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except OSError:
+        # no daemon, a stale socket, or one owned by another user
+        client.close()
+        return False
+
+    with client, client.makefile('rwb') as stream:
+        stream.write((json.dumps({"mode": mode, **request}) + "\n").encode())
+        stream.flush()
+        for line in stream:
+            event = json.loads(line)
+            if event["event"] == "done":
+                return True
+            if event["event"] == "error":
+                raise DaemonError(event["message"])
+            on_event(event)
+    raise DaemonError("daemon closed the connection before finishing the query")
+
+
+def serve_from_daemon(mode, client_parser, build_request, argv=None):
+    """
+    Send the command line query to a running daemon and exit once it has been served.
+
+    client_parser holds only the options a daemon honors, plus --daemon_socket and --no_daemon.
+    Any other option, such as --precision, --greedy or --metrics_port, configures a model in
+    this process, so it returns and the caller loads the model itself. Callers run this before
+    importing torch and transformers, which keeps the client fast.
+    """
+    args, local_options = client_parser.parse_known_args(argv)
+    if args.no_daemon or local_options:
+        return
+    try:
+        served = request_daemon(mode, build_request(args), print_event, args.daemon_socket)
+    except DaemonError as e:
+        inference_logger.error("Daemon error: %s", e)
+        sys.exit(1)
+    if served:
+        sys.exit(0)
+
+
+def print_event(event):
+    """render streamed events for the command line clients"""
+    if event["event"] == "assistant":
+        print(f"\nassistant (iteration {event['iteration']}):\n{event['content']}", flush=True)
+    elif event["event"] == "tool_call":
+        print(f"\ntool call: {json.dumps({'name': event['name'], 'arguments': event['arguments']})}", flush=True)
+    elif event["event"] == "tool":
+        print(f"\ntool:\n{event['content']}", flush=True)
+    elif event["event"] == "json_object":
+        print(f"\njson object (valid: {event['valid']}):\n{json.dumps(event['object'], indent=2)}", flush=True)
+    elif event["event"] == "validation_error":
+        print(f"\nvalidation error:\n{event['message']}", flush=True)
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        def send(event):
+            self.wfile.write((json.dumps(event, default=str) + "\n").encode())
+            self.wfile.flush()
+
+        daemon = self.server.daemon
+        try:
+            request = json.loads(self.rfile.readline())
+            if request.get("mode") != daemon.mode:
+                send({"event": "error", "message": f"daemon serves {daemon.mode} mode, not {request.get('mode')}"})
+                return
+            if request.get("model_path") not in (None, daemon.model_path):
+                send({"event": "error", "message": f"daemon serves {daemon.model_path}, not {request['model_path']}"})
+                return
+            if request.get("chat_template") not in (None, daemon.chat_template):
+                send({"event": "error", "message": f"daemon uses chat template {daemon.chat_template}, not {request['chat_template']}"})
+                return
+            # one model, so queries run one at a time; waiting clients queue on the lock
+            with daemon.lock:
+                daemon.run(request, send)
+            send({"event": "done"})
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away; the interrupted query was abandoned with it
+            pass
+        except Exception as e:
+            try:
+                send({"event": "error", "message": f"{type(e).__name__}: {e}"})
+            except OSError:
+                pass
+
+
+class InferenceDaemon:
+    """
+    Keep a model loaded and serve functioncall.py or jsonmode.py queries over a Unix socket.
+
+    Assistant messages, tool calls and tool results are streamed back to the client as
+    newline-delimited json events while the agent loop runs.
+    """
+
+    def __init__(self, mode, model_path, chat_template="chatml", load_in_4bit="False", model_options=None):
+        self.mode = mode
+        self.model_path = model_path
+        self.chat_template = chat_template
+        self.lock = threading.Lock()
+        if mode == "function_call":
+            from functioncall import ModelInference
+        else:
+            from jsonmode import ModelInference
+        self.inference = ModelInference(model_path, chat_template, load_in_4bit, **(model_options or {}))
+
+    def run(self, request, send):
+        if self.mode == "function_call":
+            self.inference.generate_function_call(
+                request["query"], self.chat_template, request.get("num_fewshot"), request.get("max_depth", 5),
+                request.get("num_candidates", 1), request.get("candidate_selection", "first"),
+                request.get("share_results", True), on_event=send
+            )
+        else:
+            self.inference.generate_json_completion(request["query"], self.chat_template, request.get("max_depth", 5), on_event=send)
+        if self.inference.completion_cache is not None:
+            inference_logger.info("Completion cache: %s", self.inference.completion_cache.stats())
+        if self.inference.speculative is not None:
+            inference_logger.info("Speculative decoding: %s", self.inference.speculative.stats())
+
+    def serve(self, socket_path):
+        if os.path.exists(socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(socket_path)
+                raise DaemonError(f"A daemon is already listening on {socket_path}")
+            except ConnectionRefusedError:
+                # left behind by a daemon that did not shut down cleanly
+                os.unlink(socket_path)
+            except OSError as e:
+                raise DaemonError(f"Cannot use {socket_path} ({e}); pass --socket_path or set HFC_DAEMON_DIR") from e
+            finally:
+                probe.close()
+
+        server = socketserver.ThreadingUnixStreamServer(socket_path, DaemonRequestHandler)
+        server.daemon_threads = True
+        server.daemon = self
+        os.chmod(socket_path, 0o600)
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        print(f"Serving {self.mode} queries for {self.model_path} on {socket_path}", flush=True)
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+
+
+if __name__ == "__main__":
+    from model_loader import add_model_arguments, model_options
+    from completion_cache import add_cache_arguments, setup_completion_cache
+    from speculative import add_speculative_arguments, setup_speculative_decoding
+    from sandbox import configure_sandbox
+
+    parser = argparse.ArgumentParser(description="Keep a model loaded and serve functioncall.py / jsonmode.py queries over a Unix socket")
+    parser.add_argument("--mode", type=str, default="function_call", choices=MODES, help="Serve function calling or json mode queries")
+    parser.add_argument("--model_path", type=str, default='NousResearch/Hermes-2-Pro-Llama-3-8B', help="Path to the model folder")
+    parser.add_argument("--chat_template", type=str, default="chatml", help="Chat template for prompt formatting")
+    parser.add_argument("--load_in_4bit", type=str, default="False", help="Option to load in 4bit with bitsandbytes")
+    parser.add_argument("--socket_path", type=str, default=None, help="Unix socket to listen on (default: hermes-<mode>.sock in $HFC_DAEMON_DIR or the temp dir)")
+    parser.add_argument("--sandbox_workers", type=int, default=2, help="Number of warm worker processes for code_interpreter")
+    parser.add_argument("--sandbox_timeout", type=int, default=30, help="Wall-clock limit in seconds for each code_interpreter call")
+    add_model_arguments(parser)
+    add_cache_arguments(parser)
+    add_speculative_arguments(parser)
+    args = parser.parse_args()
+
+    if args.mode == "function_call":
+        configure_sandbox(size=args.sandbox_workers, timeout=args.sandbox_timeout)
+    daemon = InferenceDaemon(args.mode, args.model_path, args.chat_template, args.load_in_4bit, model_options(args))
+    setup_completion_cache(daemon.inference, args)
+    setup_speculative_decoding(daemon.inference, args, model_options(args))
+    daemon.serve(args.socket_path or default_socket_path(args.mode))
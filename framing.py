@@ -0,0 +1,38 @@
+import os
+import time
+import select
+import struct
+
+# length-prefixed frames over pipes, shared by the sandbox and replica worker processes
+FRAME_HEADER = struct.Struct("!I")
+
+
+def write_frame(stream, payload):
+    stream.write(FRAME_HEADER.pack(len(payload)) + payload)
+    stream.flush()
+
+
+def read_exact(fd, size, deadline=None):
+    chunks = []
+    while size > 0:
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("worker did not respond in time")
+            ready, _, _ = select.select([fd], [], [], remaining)
+            if not ready:
+                raise TimeoutError("worker did not respond in time")
+        chunk = os.read(fd, min(size, 1 << 20))
+        if not chunk:
+            raise EOFError("worker closed the channel")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def read_frame(fd, deadline=None, max_bytes=None):
+    """read one frame from a file descriptor, giving up at deadline (a time.monotonic() value)"""
+    (size,) = FRAME_HEADER.unpack(read_exact(fd, FRAME_HEADER.size, deadline))
+    if max_bytes is not None and size > max_bytes:
+        raise OverflowError(f"worker result of {size} bytes exceeds the {max_bytes} byte limit")
+    return read_exact(fd, size, deadline)
@@ -1,47 +1,90 @@
 import argparse
-import torch
+
+from daemon import serve_from_daemon
+
+# options a running daemon honors; the full parser in __main__ extends them
+client_parser = argparse.ArgumentParser(add_help=False)
+client_parser.add_argument("--model_path", type=str, help="Path to the model folder")
+client_parser.add_argument("--chat_template", type=str, default="chatml", help="Chat template for prompt formatting")
+client_parser.add_argument("--num_fewshot", type=int, default=None, help="Option to use json mode examples")
+client_parser.add_argument("--query", type=str, default="I need the current stock price of Tesla (TSLA)")
+client_parser.add_argument("--max_depth", type=int, default=5, help="Maximum number of recursive iteration")
+client_parser.add_argument("--num_candidates", type=int, default=1, help="Number of completions sampled per turn in one batched generate call")
+client_parser.add_argument("--candidate_selection", type=str, default="first", choices=["first", "majority"], help="Keep the first valid candidate or the majority-agreeing valid one")
+client_parser.add_argument("--disable_result_handles", action="store_true", help="Inline DataFrame results in the prompt instead of sharing them through result handles")
+client_parser.add_argument("--daemon_socket", type=str, default=None, help="Socket of a running daemon.py (default: hermes-function_call.sock in the temp dir)")
+client_parser.add_argument("--no_daemon", action="store_true", help="Always load the model in this process instead of using a running daemon")
+
+if __name__ == "__main__":
+    # hand the query to a running daemon before paying for torch, transformers and the tools
+    serve_from_daemon("function_call", client_parser, lambda args: {
+        "query": args.query, "model_path": args.model_path, "chat_template": args.chat_template,
+        "num_fewshot": args.num_fewshot, "max_depth": args.max_depth, "num_candidates": args.num_candidates,
+        "candidate_selection": args.candidate_selection, "share_results": not args.disable_result_handles,
+    })
+
 import json
+import time
+import uuid
 
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    BitsAndBytesConfig
-)
+from collections import Counter
+
+from transformers import AutoTokenizer
 
 import functions
 from prompter import PromptManager
+from model_loader import load_model, add_model_arguments, model_options, left_pad_batch, decode_batch
+from completion_cache import add_cache_arguments, setup_completion_cache
+from speculative import add_speculative_arguments, setup_speculative_decoding
 from validator import validate_function_call_schema
+from sandbox import configure_sandbox
+from result_store import ResultStore
+from tool_cache import get_tool_cache
+from instrumentation import (
+    Instrumentation,
+    FirstTokenTimer,
+    build_instrumentation,
+    kv_cache_bytes,
+    peak_memory_bytes,
+    reset_peak_memory
+)
 
 from utils import (
     print_nous_text_art,
     inference_logger,
     get_assistant_message,
     get_chat_template,
+    LogPayload,
     validate_and_extract_tool_calls
 )
 
 class ModelInference:
-    def __init__(self, model_path, chat_template, load_in_4bit):
+    def __init__(self, model_path, chat_template, load_in_4bit="False", instrumentation=None, device="auto",
+                 precision="auto", attn_implementation="auto", compile_model=False, num_threads=None,
+                 mmap_weights=False):
         inference_logger.info(print_nous_text_art())
         self.prompter = PromptManager()
-        self.bnb_config = None
-
-        if load_in_4bit == "True":
-            self.bnb_config = BitsAndBytesConfig(
-                load_in_4bit=True,
-                bnb_4bit_quant_type="nf4",
-                bnb_4bit_use_double_quant=True,
-            )
-        self.model = AutoModelForCausalLM.from_pretrained(
+        self.instrumentation = instrumentation or Instrumentation()
+        self.completion_cache = None
+        self.speculative = None
+        self.model = load_model(
             model_path,
-            trust_remote_code=True,
-            return_dict=True,
-            quantization_config=self.bnb_config,
-            torch_dtype=torch.float16,
-            attn_implementation="flash_attention_2",
-            device_map="auto",
+            device=device,
+            precision=precision,
+            attn_implementation=attn_implementation,
+            compile_model=compile_model,
+            num_threads=num_threads,
+            load_in_4bit=load_in_4bit,
+            mmap_weights=mmap_weights,
         )
 
+        self.generation_kwargs = {
+            "max_new_tokens": 1500,
+            "temperature": 0.8,
+            "repetition_penalty": 1.1,
+            "do_sample": True,
+        }
+
         self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
         self.tokenizer.pad_token = self.tokenizer.eos_token
         self.tokenizer.padding_side = "left"
@@ -56,13 +99,16 @@ class ModelInference:
 
     def process_completion_and_validate(self, completion, chat_template):
 
-        assistant_message = get_assistant_message(completion, chat_template, self.tokenizer.eos_token)
+        with self.instrumentation.span("extract") as span:
+            assistant_message = get_assistant_message(completion, chat_template, self.tokenizer.eos_token)
+            if assistant_message:
+                validation, tool_calls, error_message = validate_and_extract_tool_calls(assistant_message)
+                span["num_tool_calls"] = len(tool_calls)
 
         if assistant_message:
-            validation, tool_calls, error_message = validate_and_extract_tool_calls(assistant_message)
 
             if validation:
-                inference_logger.info(f"parsed tool calls:\n{json.dumps(tool_calls, indent=2)}")
+                inference_logger.info("parsed tool calls:\n%s", LogPayload(tool_calls, indent=2))
                 return tool_calls, assistant_message, error_message
             else:
                 tool_calls = None
@@ -71,111 +117,307 @@ class ModelInference:
             inference_logger.warning("Assistant message is None")
             raise ValueError("Assistant message is None")
         
-    def execute_function_call(self, tool_call):
+    def execute_function_call(self, tool_call, result_store=None, tool_session=None):
         function_name = tool_call.get("name")
         function_to_call = getattr(functions, function_name, None)
         function_args = tool_call.get("arguments", {})
 
-        inference_logger.info(f"Invoking function call {function_name} ...")
-        function_response = function_to_call(*function_args.values())
-        results_dict = f'{{"name": "{function_name}", "content": {function_response}}}'
+        inference_logger.info("Invoking function call %s ...", function_name)
+        with self.instrumentation.span("tool_call", tool=function_name) as span:
+            # repeated calls are served from the tool's cache policy declared in functions.py
+            function_response, policy, span["cache"] = get_tool_cache().call(function_name, function_args, function_to_call, tool_session)
+            span["cache_policy"] = policy.scope
+            span["shared"] = result_store is not None and result_store.is_shareable(function_response)
+            if span["shared"]:
+                # keep tabular results in shared memory and send the model a handle plus preview
+                function_response = result_store.share(function_response)
+            results_dict = f'{{"name": "{function_name}", "content": {function_response}}}'
+            span["result_chars"] = len(results_dict)
         return results_dict
     
     def run_inference(self, prompt):
-        inputs = self.tokenizer.apply_chat_template(
-            prompt,
-            add_generation_prompt=True,
-            return_tensors='pt'
-        )
+        return self.run_inference_candidates(prompt, num_candidates=1)[0]
 
-        tokens = self.model.generate(
+    def run_inference_candidates(self, prompt, num_candidates):
+        """sample num_candidates completions in one batched generate call sharing the prompt prefill"""
+        with self.instrumentation.span("chat_template"):
+            prompt_text = self.tokenizer.apply_chat_template(
+                prompt,
+                add_generation_prompt=True,
+                tokenize=False
+            )
+        with self.instrumentation.span("tokenize") as span:
+            inputs = self.tokenizer(prompt_text, return_tensors='pt', add_special_tokens=False)["input_ids"]
+            span["prompt_tokens"] = inputs.shape[-1]
+
+        cache_key = None
+        if self.completion_cache is not None and self.completion_cache.enabled_for(self.generation_kwargs):
+            with self.instrumentation.span("cache_lookup") as span:
+                cache_key = self.completion_cache.key(self.model, self.generation_kwargs, inputs[0].tolist(), num_candidates)
+                completions = self.completion_cache.get(cache_key)
+                span["hit"] = completions is not None
+            if completions is not None:
+                return completions
+
+        if num_candidates > 1 and not self.generation_kwargs.get("do_sample", False):
+            raise ValueError("Greedy decoding returns a single sequence; sampling is needed for num_candidates > 1")
+
+        # speculative decoding verifies drafts for a single sequence, so candidates skip it
+        speculative_kwargs = {}
+        if self.speculative is not None and num_candidates == 1:
+            speculative_kwargs = self.speculative.generate_kwargs()
+
+        tokens = self.timed_generate(
             inputs.to(self.model.device),
-            max_new_tokens=1500,
-            temperature=0.8,
-            repetition_penalty=1.1,
-            do_sample=True,
-            eos_token_id=self.tokenizer.eos_token_id
+            num_return_sequences=num_candidates,
+            eos_token_id=self.tokenizer.eos_token_id,
+            **speculative_kwargs,
+            **self.generation_kwargs
+        )
+        if speculative_kwargs and "max_new_tokens" in self.generation_kwargs:
+            # the last accepted draft can run past max_new_tokens
+            tokens = tokens[:, :inputs.shape[-1] + self.generation_kwargs["max_new_tokens"]]
+        with self.instrumentation.span("decode_text", num_sequences=len(tokens)):
+            completions = [
+                self.tokenizer.decode(sequence, skip_special_tokens=False, clean_up_tokenization_space=True)
+                for sequence in tokens
+            ]
+        if cache_key is not None:
+            self.completion_cache.put(cache_key, completions)
+        return completions
+
+    def timed_generate(self, input_ids, **kwargs):
+        """model.generate, recording prefill, decode and memory spans when a sink is attached"""
+        if not self.instrumentation.sinks:
+            return self.model.generate(input_ids=input_ids, **kwargs)
+
+        device = self.model.device
+        reset_peak_memory(device)
+        speculative = self.speculative is not None and ("assistant_model" in kwargs or "prompt_lookup_num_tokens" in kwargs)
+        if speculative:
+            drafted_before, accepted_before, steps_before = self.speculative.counts()
+        timer = FirstTokenTimer()
+        tokens = self.model.generate(input_ids=input_ids, streamer=timer, **kwargs)
+        elapsed = time.perf_counter() - timer.start
+
+        batch_size, prompt_tokens = input_ids.shape
+        pad_token_id = kwargs.get("pad_token_id", self.tokenizer.pad_token_id)
+        generated_tokens = int((tokens[:, prompt_tokens:] != pad_token_id).sum())
+        prefill = (timer.first_token_at or time.perf_counter()) - timer.start
+        decode = max(elapsed - prefill, 0.0)
+        self.instrumentation.record("prefill", prefill, prompt_tokens=batch_size * prompt_tokens, batch_size=batch_size)
+        self.instrumentation.record(
+            "decode", decode,
+            generated_tokens=generated_tokens,
+            tokens_per_second=generated_tokens / decode if decode else None
+        )
+        self.instrumentation.record(
+            "generate", elapsed,
+            prompt_tokens=batch_size * prompt_tokens,
+            generated_tokens=generated_tokens,
+            num_sequences=tokens.shape[0],
+            time_to_first_token_s=prefill,
+            peak_memory_bytes=peak_memory_bytes(device),
+            kv_cache_bytes=kv_cache_bytes(self.model.config, tokens.shape[0], tokens.shape[1], self.model.dtype.itemsize),
+        )
+        if speculative:
+            drafted, accepted, steps = (after - before for after, before in zip(
+                self.speculative.counts(), (drafted_before, accepted_before, steps_before)))
+            self.instrumentation.record(
+                "speculation", decode,
+                mode=self.speculative.mode,
+                verify_steps=steps,
+                drafted_tokens=drafted,
+                accepted_tokens=accepted,
+                acceptance_rate=accepted / drafted if drafted else None,
+            )
+        return tokens
+
+    def tokenize_prompt(self, prompt):
+        """render the chat template and tokenize on the CPU, ahead of batched generation"""
+        with self.instrumentation.span("tokenize") as span:
+            input_ids = self.tokenizer.apply_chat_template(prompt, add_generation_prompt=True)
+            span["prompt_tokens"] = len(input_ids)
+        return input_ids
+
+    def generate_batch(self, batch_input_ids):
+        """left-pad tokenized prompts from different conversations and generate them in one call"""
+        pad_token_id = self.tokenizer.pad_token_id
+        input_ids, attention_mask = left_pad_batch(batch_input_ids, pad_token_id)
+        tokens = self.timed_generate(
+            input_ids.to(self.model.device),
+            attention_mask=attention_mask.to(self.model.device),
+            eos_token_id=self.tokenizer.eos_token_id,
+            pad_token_id=pad_token_id,
+            **self.generation_kwargs
         )
-        completion = self.tokenizer.decode(tokens[0], skip_special_tokens=False, clean_up_tokenization_space=True)
-        return completion
-
-    def generate_function_call(self, query, chat_template, num_fewshot, max_depth=5):
-        try:
-            depth = 0
-            user_message = f"{query}\nThis is the first turn and you don't have <tool_results> to analyze yet"
-            chat = [{"role": "user", "content": user_message}]
-            tools = functions.get_openai_tools()
-            prompt = self.prompter.generate_prompt(chat, tools, num_fewshot)
-            completion = self.run_inference(prompt)
-
-            def recursive_loop(prompt, completion, depth):
-                nonlocal max_depth
-                tool_calls, assistant_message, error_message = self.process_completion_and_validate(completion, chat_template)
-                prompt.append({"role": "assistant", "content": assistant_message})
-
-                tool_message = f"Agent iteration {depth} to assist with user query: {query}\n"
-                if tool_calls:
-                    inference_logger.info(f"Assistant Message:\n{assistant_message}")
-
-                    for tool_call in tool_calls:
-                        validation, message = validate_function_call_schema(tool_call, tools)
-                        if validation:
-                            try:
-                                function_response = self.execute_function_call(tool_call)
-                                tool_message += f"<tool_response>\n{function_response}\n</tool_response>\n"
-                                inference_logger.info(f"Here's the response from the function call: {tool_call.get('name')}\n{function_response}")
-                            except Exception as e:
-                                inference_logger.info(f"Could not execute function: {e}")
-                                tool_message += f"<tool_response>\nThere was an error when executing the function: {tool_call.get('name')}\nHere's the error traceback: {e}\nPlease call this function again with correct arguments within XML tags <tool_call></tool_call>\n</tool_response>\n"
-                        else:
-                            inference_logger.info(message)
-                            tool_message += f"<tool_response>\nThere was an error validating function call against function signature: {tool_call.get('name')}\nHere's the error traceback: {message}\nPlease call this function again with correct arguments within XML tags <tool_call></tool_call>\n</tool_response>\n"
-                    prompt.append({"role": "tool", "content": tool_message})
-
-                    depth += 1
-                    if depth >= max_depth:
-                        print(f"Maximum recursion depth reached ({max_depth}). Stopping recursion.")
-                        return
-
-                    completion = self.run_inference(prompt)
-                    recursive_loop(prompt, completion, depth)
-                elif error_message:
-                    inference_logger.info(f"Assistant Message:\n{assistant_message}")
-                    tool_message += f"<tool_response>\nThere was an error parsing function calls\n Here's the error stack trace: {error_message}\nPlease call the function again with correct syntax<tool_response>"
-                    prompt.append({"role": "tool", "content": tool_message})
-
-                    depth += 1
-                    if depth >= max_depth:
-                        print(f"Maximum recursion depth reached ({max_depth}). Stopping recursion.")
-                        return
-
-                    completion = self.run_inference(prompt)
-                    recursive_loop(prompt, completion, depth)
+        with self.instrumentation.span("decode_text", num_sequences=len(batch_input_ids)):
+            return decode_batch(self.tokenizer, tokens, batch_input_ids, pad_token_id)
+
+    def select_candidate(self, completions, chat_template, tools, candidate_selection="first"):
+        """pick the first (or majority-agreeing) candidate whose tool calls parse and pass schema validation"""
+        valid_candidates = []
+        for completion in completions:
+            try:
+                tool_calls, _, error_message = self.process_completion_and_validate(completion, chat_template)
+            except ValueError:
+                continue
+
+            if tool_calls:
+                if not all(validate_function_call_schema(tool_call, tools)[0] for tool_call in tool_calls):
+                    continue
+                key = json.dumps(tool_calls, sort_keys=True)
+            elif error_message:
+                continue
+            else:
+                # plain assistant answer without tool calls
+                key = None
+
+            if candidate_selection == "first":
+                return completion
+            valid_candidates.append((key, completion))
+
+        if not valid_candidates:
+            inference_logger.info("No valid candidate among %d samples, keeping the first one", len(completions))
+            return completions[0]
+
+        majority_key, votes = Counter(key for key, _ in valid_candidates).most_common(1)[0]
+        inference_logger.info("Selected candidate with %d/%d agreeing votes", votes, len(completions))
+        return next(completion for key, completion in valid_candidates if key == majority_key)
+
+    def sample_completion(self, prompt, chat_template, tools, num_candidates=1, candidate_selection="first"):
+        if num_candidates <= 1:
+            return self.run_inference(prompt)
+        completions = self.run_inference_candidates(prompt, num_candidates)
+        return self.select_candidate(completions, chat_template, tools, candidate_selection)
+
+    def build_prompt(self, query, tools, num_fewshot=None):
+        user_message = f"{query}\nThis is the first turn and you don't have <tool_results> to analyze yet"
+        chat = [{"role": "user", "content": user_message}]
+        return self.prompter.generate_prompt(chat, tools, num_fewshot)
+
+    def process_turn(self, completion, chat_template, tools, query, depth, result_store=None, tool_session=None):
+        """
+        Parse one completion and run its tool calls.
+
+        Returns the assistant message, the parsed tool calls and the content of the
+        tool turn to feed back, which is None when the assistant gave a final answer.
+        """
+        tool_calls, assistant_message, error_message = self.process_completion_and_validate(completion, chat_template)
+        inference_logger.info("Assistant Message:\n%s", LogPayload(assistant_message))
+
+        tool_message = f"Agent iteration {depth} to assist with user query: {query}\n"
+        if tool_calls:
+            for tool_call in tool_calls:
+                with self.instrumentation.span("validate", tool=tool_call.get("name")) as span:
+                    validation, message = validate_function_call_schema(tool_call, tools)
+                    span["valid"] = validation
+                if validation:
+                    try:
+                        function_response = self.execute_function_call(tool_call, result_store, tool_session)
+                        tool_message += f"<tool_response>\n{function_response}\n</tool_response>\n"
+                        inference_logger.info("Here's the response from the function call: %s\n%s", tool_call.get('name'), LogPayload(function_response))
+                    except Exception as e:
+                        inference_logger.info("Could not execute function: %s", e)
+                        tool_message += f"<tool_response>\nThere was an error when executing the function: {tool_call.get('name')}\nHere's the error traceback: {e}\nPlease call this function again with correct arguments within XML tags <tool_call></tool_call>\n</tool_response>\n"
+                else:
+                    inference_logger.info(message)
+                    tool_message += f"<tool_response>\nThere was an error validating function call against function signature: {tool_call.get('name')}\nHere's the error traceback: {message}\nPlease call this function again with correct arguments within XML tags <tool_call></tool_call>\n</tool_response>\n"
+        elif error_message:
+            tool_message += f"<tool_response>\nThere was an error parsing function calls\n Here's the error stack trace: {error_message}\nPlease call the function again with correct syntax<tool_response>"
+        else:
+            tool_message = None
+        return assistant_message, tool_calls, tool_message
+
+    def generate_function_call(self, query, chat_template, num_fewshot, max_depth=5, num_candidates=1, candidate_selection="first", share_results=True, history=None, on_event=None):
+        result_store = ResultStore() if share_results else None
+        # results of tools with a session cache policy are reused within this conversation
+        tool_session = {}
+        with self.instrumentation.context(session=uuid.uuid4().hex[:12]):
+            try:
+                depth = 0
+                tools = functions.get_openai_tools()
+                if history:
+                    # follow-up query in an existing conversation
+                    prompt = history + [{"role": "user", "content": query}]
                 else:
-                    inference_logger.info(f"Assistant Message:\n{assistant_message}")
+                    prompt = self.build_prompt(query, tools, num_fewshot)
+                with self.instrumentation.context(iteration=depth):
+                    completion = self.sample_completion(prompt, chat_template, tools, num_candidates, candidate_selection)
+
+                def recursive_loop(prompt, completion, depth):
+                    nonlocal max_depth
+                    with self.instrumentation.context(iteration=depth):
+                        assistant_message, tool_calls, tool_message = self.process_turn(completion, chat_template, tools, query, depth, result_store, tool_session)
+                    prompt.append({"role": "assistant", "content": assistant_message})
+
+                    if on_event is not None:
+                        # stream the turn to the caller, e.g. a daemon client
+                        on_event({"event": "assistant", "iteration": depth, "content": assistant_message})
+                        for tool_call in tool_calls or []:
+                            on_event({"event": "tool_call", "iteration": depth, "name": tool_call.get("name"), "arguments": tool_call.get("arguments", {})})
+                        if tool_message is not None:
+                            on_event({"event": "tool", "iteration": depth, "content": tool_message})
 
-            recursive_loop(prompt, completion, depth)
+                    if tool_message is not None:
+                        prompt.append({"role": "tool", "content": tool_message})
 
-        except Exception as e:
-            inference_logger.error(f"Exception occurred: {e}")
-            raise e
+                        depth += 1
+                        if depth >= max_depth:
+                            print(f"Maximum recursion depth reached ({max_depth}). Stopping recursion.")
+                            return
+
+                        with self.instrumentation.context(iteration=depth):
+                            completion = self.sample_completion(prompt, chat_template, tools, num_candidates, candidate_selection)
+                        recursive_loop(prompt, completion, depth)
+
+                recursive_loop(prompt, completion, depth)
+                return prompt
+
+            except Exception as e:
+                inference_logger.error("Exception occurred: %s", e)
+                raise e
+            finally:
+                if result_store is not None:
+                    result_store.close()
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Run recursive function calling loop")
-    parser.add_argument("--model_path", type=str, help="Path to the model folder")
-    parser.add_argument("--chat_template", type=str, default="chatml", help="Chat template for prompt formatting")
-    parser.add_argument("--num_fewshot", type=int, default=None, help="Option to use json mode examples")
+    parser = argparse.ArgumentParser(description="Run recursive function calling loop", parents=[client_parser])
     parser.add_argument("--load_in_4bit", type=str, default="False", help="Option to load in 4bit with bitsandbytes")
-    parser.add_argument("--query", type=str, default="I need the current stock price of Tesla (TSLA)")
-    parser.add_argument("--max_depth", type=int, default=5, help="Maximum number of recursive iteration")
+    parser.add_argument("--sandbox_workers", type=int, default=2, help="Number of warm worker processes for code_interpreter")
+    parser.add_argument("--sandbox_timeout", type=int, default=30, help="Wall-clock limit in seconds for each code_interpreter call")
+    parser.add_argument("--metrics_jsonl", type=str, default=None, help="Append per-stage timing and token spans to this JSONL file")
+    parser.add_argument("--metrics_port", type=int, default=None, help="Serve Prometheus metrics for the spans on this port")
+    add_model_arguments(parser)
+    add_cache_arguments(parser)
+    add_speculative_arguments(parser)
     args = parser.parse_args()
+    if args.speculative != "off" and args.num_candidates > 1:
+        parser.error("--speculative generates one sequence at a time and needs --num_candidates 1")
+    if args.greedy and args.num_candidates > 1:
+        parser.error("--greedy decodes a single sequence; candidates need sampling, so drop --greedy or use --num_candidates 1")
+
+    instrumentation = build_instrumentation(args.metrics_jsonl, args.metrics_port)
+
+    # start the code_interpreter workers so they warm up while the model loads
+    configure_sandbox(size=args.sandbox_workers, timeout=args.sandbox_timeout)
 
     # specify custom model path
     if args.model_path:
-        inference = ModelInference(args.model_path, args.chat_template, args.load_in_4bit)
+        inference = ModelInference(args.model_path, args.chat_template, args.load_in_4bit, instrumentation, **model_options(args))
     else:
         model_path = 'NousResearch/Hermes-2-Pro-Llama-3-8B'
-        inference = ModelInference(model_path, args.chat_template, args.load_in_4bit)
+        inference = ModelInference(model_path, args.chat_template, args.load_in_4bit, instrumentation, **model_options(args))
         
+    completion_cache = setup_completion_cache(inference, args)
+    speculative = setup_speculative_decoding(inference, args, model_options(args))
+
     # Run the model evaluator
-    inference.generate_function_call(args.query, args.chat_template, args.num_fewshot, args.max_depth)
+    inference.generate_function_call(
+        args.query, args.chat_template, args.num_fewshot, args.max_depth,
+        args.num_candidates, args.candidate_selection, not args.disable_result_handles
+    )
+    if completion_cache is not None:
+        inference_logger.info("Completion cache: %s", completion_cache.stats())
+    if speculative is not None:
+        inference_logger.info("Speculative decoding: %s", speculative.stats())
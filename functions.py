@@ -1,20 +1,28 @@
-import re
-import inspect
-import requests
 import pandas as pd
 import yfinance as yf
-import concurrent.futures
 
 from typing import List
 from bs4 import BeautifulSoup
 from utils import inference_logger
+from sandbox import get_sandbox_pool
+from http_client import get_http_client
+from html_extract import extract_page_content
+from tool_cache import cache_policy
 from langchain.tools import tool
 from langchain_core.utils.function_calling import convert_to_openai_tool
 
+GOOGLE_SEARCH_URL = 'https://www.google.com/search'
+# character budget for the text and table content kept from each scraped page
+MAX_PAGE_CHARS = 4000
+# seconds market data results are reused across conversations
+QUOTE_TTL = 60
+NEWS_TTL = 15 * 60
+FUNDAMENTALS_TTL = 6 * 3600
+
 @tool
 def code_interpreter(code_markdown: str) -> dict | str:
     """
-    Execute the provided Python code string on the terminal using exec.
+    Execute the provided Python code string in a sandboxed worker process.
 
     The string should contain valid, executable and pure Python code in markdown syntax.
     Code should also import any required Python packages.
@@ -28,40 +36,22 @@ def code_interpreter(code_markdown: str) -> dict | str:
             or an error message if an exception occurred.
 
     Note:
-        Use this function with caution, as executing arbitrary code can pose security risks.
+        Code runs in a warm worker from the sandbox pool with CPU, memory and wall-clock limits.
     """
     try:
         # Extracting code from Markdown code block
         code_lines = code_markdown.split('\n')[1:-1]
         code_without_markdown = '\n'.join(code_lines)
 
-        # Create a new namespace for code execution
-        exec_namespace = {}
-
-        # Execute the code in the new namespace
-        exec(code_without_markdown, exec_namespace)
-
-        # Collect variables and function call results
-        result_dict = {}
-        for name, value in exec_namespace.items():
-            if callable(value):
-                try:
-                    result_dict[name] = value()
-                except TypeError:
-                    # If the function requires arguments, attempt to call it with arguments from the namespace
-                    arg_names = inspect.getfullargspec(value).args
-                    args = {arg_name: exec_namespace.get(arg_name) for arg_name in arg_names}
-                    result_dict[name] = value(**args)
-            elif not name.startswith('_'):  # Exclude variables starting with '_'
-                result_dict[name] = value
-
-        return result_dict
+        # Execute the code in a pooled worker process and collect its variables
+        return get_sandbox_pool().run(code_without_markdown)
 
     except Exception as e:
         error_message = f"An error occurred: {e}"
         inference_logger.error(error_message)
         return error_message
 
+@cache_policy("session")
 @tool
 def google_search_and_scrape(query: str) -> dict:
     """
@@ -74,31 +64,25 @@ def google_search_and_scrape(query: str) -> dict:
         list: A list of dictionaries containing the URL, text content, and table data for each scraped page.
     """
     num_results = 2
-    url = 'https://www.google.com/search'
     params = {'q': query, 'num': num_results}
-    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.61 Safari/537.3'}
-    
-    inference_logger.info(f"Performing google search with query: {query}\nplease wait...")
-    response = requests.get(url, params=params, headers=headers)
-    soup = BeautifulSoup(response.text, 'html.parser')
+    client = get_http_client()
+
+    inference_logger.info("Performing google search with query: %s\nplease wait...", query)
+    soup = BeautifulSoup(client.get_text(GOOGLE_SEARCH_URL, params=params), 'html.parser')
     urls = [result.find('a')['href'] for result in soup.find_all('div', class_='tF2Cxc')]
-    
-    inference_logger.info(f"Scraping text from urls, please wait...") 
+
+    inference_logger.info("Scraping text from urls, please wait...")
     [inference_logger.info(url) for url in urls]
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        futures = [executor.submit(lambda url: (url, requests.get(url, headers=headers).text if isinstance(url, str) else None), url) for url in urls[:num_results] if isinstance(url, str)]
-        results = []
-        for future in concurrent.futures.as_completed(futures):
-            url, html = future.result()
-            soup = BeautifulSoup(html, 'html.parser')
-            paragraphs = [p.text.strip() for p in soup.find_all('p') if p.text.strip()]
-            text_content = ' '.join(paragraphs)
-            text_content = re.sub(r'\s+', ' ', text_content)
-            table_data = [[cell.get_text(strip=True) for cell in row.find_all('td')] for table in soup.find_all('table') for row in table.find_all('tr')]
-            if text_content or table_data:
-                results.append({'url': url, 'content': text_content, 'tables': table_data})
+    results = []
+    for url, html in client.fetch_many([url for url in urls[:num_results] if isinstance(url, str)]):
+        if html is None:
+            continue
+        page = extract_page_content(html, max_chars=MAX_PAGE_CHARS)
+        if page['content'] or page['tables']:
+            results.append({'url': url, 'content': page['content'], 'tables': page['tables']})
     return results
 
+@cache_policy("global", ttl=QUOTE_TTL)
 @tool
 def get_current_stock_price(symbol: str) -> float:
   """
@@ -119,6 +103,7 @@ def get_current_stock_price(symbol: str) -> float:
     print(f"Error fetching current price for {symbol}: {e}")
     return None
 
+@cache_policy("global", ttl=FUNDAMENTALS_TTL)
 @tool
 def get_stock_fundamentals(symbol: str) -> dict:
     """
@@ -165,6 +150,7 @@ def get_stock_fundamentals(symbol: str) -> dict:
         print(f"Error getting fundamentals for {symbol}: {e}")
         return {}
 
+@cache_policy("global", ttl=FUNDAMENTALS_TTL)
 @tool
 def get_financial_statements(symbol: str) -> dict:
     """
@@ -184,6 +170,7 @@ def get_financial_statements(symbol: str) -> dict:
         print(f"Error fetching financial statements for {symbol}: {e}")
         return {}
 
+@cache_policy("global", ttl=FUNDAMENTALS_TTL)
 @tool
 def get_key_financial_ratios(symbol: str) -> dict:
     """
@@ -203,6 +190,7 @@ def get_key_financial_ratios(symbol: str) -> dict:
         print(f"Error fetching key financial ratios for {symbol}: {e}")
         return {}
 
+@cache_policy("global", ttl=FUNDAMENTALS_TTL)
 @tool
 def get_analyst_recommendations(symbol: str) -> pd.DataFrame:
     """
@@ -222,6 +210,7 @@ def get_analyst_recommendations(symbol: str) -> pd.DataFrame:
         print(f"Error fetching analyst recommendations for {symbol}: {e}")
         return pd.DataFrame()
 
+@cache_policy("global", ttl=FUNDAMENTALS_TTL)
 @tool
 def get_dividend_data(symbol: str) -> pd.DataFrame:
     """
@@ -241,6 +230,7 @@ def get_dividend_data(symbol: str) -> pd.DataFrame:
         print(f"Error fetching dividend data for {symbol}: {e}")
         return pd.DataFrame()
 
+@cache_policy("global", ttl=NEWS_TTL)
 @tool
 def get_company_news(symbol: str) -> pd.DataFrame:
     """
@@ -259,6 +249,7 @@ def get_company_news(symbol: str) -> pd.DataFrame:
         print(f"Error fetching company news for {symbol}: {e}")
         return pd.DataFrame()
 
+@cache_policy("global", ttl=NEWS_TTL)
 @tool
 def get_technical_indicators(symbol: str) -> pd.DataFrame:
     """
@@ -277,6 +268,7 @@ def get_technical_indicators(symbol: str) -> pd.DataFrame:
         print(f"Error fetching technical indicators for {symbol}: {e}")
         return pd.DataFrame()
 
+@cache_policy("global", ttl=FUNDAMENTALS_TTL)
 @tool
 def get_company_profile(symbol: str) -> dict:
     """
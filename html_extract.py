@@ -0,0 +1,184 @@
+import re
+import hashlib
+
+from html.parser import HTMLParser
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# text inside these tags is markup, code or site chrome rather than page content
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "nav", "header", "footer", "aside", "form"}
+BLOCK_TAGS = {"p", "li", "h1", "h2", "h3", "h4", "blockquote"}
+CHUNK_SIZE = 16 * 1024
+WHITESPACE = re.compile(r"\s+")
+
+
+class ContentCollector:
+    """
+    Parser target that keeps paragraph text and table cells until a character budget is spent.
+
+    Paragraphs that repeat (cookie banners, share buttons, related-link blurbs) are
+    kept once. Works as an lxml parser target and behind the stdlib fallback parser.
+    """
+
+    def __init__(self, max_chars=4000, max_table_rows=50, min_paragraph_chars=20):
+        self.max_chars = max_chars
+        self.max_table_rows = max_table_rows
+        self.min_paragraph_chars = min_paragraph_chars
+        self.paragraphs = []
+        self.tables = []
+        self.chars = 0
+        self.done = False
+        self._seen = set()
+        self._skip_depth = 0
+        self._block = None
+        self._table_depth = 0
+        self._row = None
+        self._cell = None
+        self._buffered = 0
+
+    def _spend(self, text):
+        self.chars += len(text)
+        # once no paragraph can fit any more, the rest of the page is not worth parsing
+        if self.max_chars - self.chars < self.min_paragraph_chars:
+            self.done = True
+
+    def _flush_block(self):
+        if self._block is None:
+            return
+        text = WHITESPACE.sub(" ", "".join(self._block)).strip()
+        self._block = None
+        if len(text) < self.min_paragraph_chars:
+            return
+        digest = hashlib.blake2b(text.lower().encode(), digest_size=8).digest()
+        if digest in self._seen:
+            return
+        self._seen.add(digest)
+        text = text[:max(self.max_chars - self.chars, 0)]
+        self.paragraphs.append(text)
+        self._spend(text)
+
+    def start(self, tag, attrib=None):
+        if self.done:
+            return
+        if tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif self._skip_depth:
+            return
+        elif tag == "table":
+            self._flush_block()
+            self._table_depth += 1
+        elif self._table_depth:
+            if tag == "tr":
+                self._row = []
+            elif tag == "td" and self._row is not None:
+                self._cell = []
+                self._buffered = 0
+        elif tag in BLOCK_TAGS:
+            # an unclosed <p> ends where the next block starts
+            self._flush_block()
+            self._block = []
+            self._buffered = 0
+
+    def end(self, tag):
+        if self.done:
+            return
+        if tag in SKIP_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif self._skip_depth:
+            return
+        elif tag == "table":
+            self._table_depth = max(self._table_depth - 1, 0)
+            self._row = self._cell = None
+        elif self._table_depth:
+            if tag == "td" and self._cell is not None:
+                self._row.append(WHITESPACE.sub(" ", "".join(self._cell)).strip())
+                self._cell = None
+            elif tag == "tr" and self._row is not None:
+                row, self._row = self._row, None
+                if any(row) and len(self.tables) < self.max_table_rows:
+                    self.tables.append(row)
+                    self._spend(" ".join(row))
+        elif tag in BLOCK_TAGS:
+            self._flush_block()
+
+    def data(self, text):
+        if self.done or self._skip_depth:
+            return
+        buffer = self._cell if self._cell is not None else self._block
+        if buffer is None:
+            return
+        # one huge paragraph or cell must not be buffered past what the budget can still take;
+        # whitespace is collapsed first so this counts characters the same way _spend does
+        text = WHITESPACE.sub(" ", text)
+        room = self.max_chars - self.chars - self._buffered
+        if room <= 0:
+            return
+        buffer.append(text[:room])
+        self._buffered += min(len(text), room)
+        if buffer is self._block and self._buffered >= self.max_chars - self.chars:
+            # the paragraph fills the budget; keep what fits and let the caller stop feeding,
+            # even when the clipped paragraph is dropped as too short or repeated
+            self._flush_block()
+            self.done = True
+
+    def close(self):
+        if not self.done:
+            self._flush_block()
+        return {"content": " ".join(self.paragraphs), "tables": self.tables}
+
+
+class _StdlibParser(HTMLParser):
+    """html.parser fallback that forwards events to a ContentCollector"""
+
+    def __init__(self, target):
+        super().__init__(convert_charrefs=True)
+        self.target = target
+
+    def handle_starttag(self, tag, attrs):
+        self.target.start(tag)
+
+    def handle_endtag(self, tag):
+        self.target.end(tag)
+
+    def handle_data(self, data):
+        self.target.data(data)
+
+
+def extract_page_content(html, max_chars=4000, max_table_rows=50, use_lxml=True):
+    """
+    Extract deduplicated paragraph text and table rows from an HTML page.
+
+    The document is fed to the parser in chunks and parsing stops as soon as
+    max_chars of content has been collected, so cost is bounded by the budget
+    rather than the page size.
+
+    Args:
+        html (str): The page markup.
+        max_chars (int): Character budget for paragraphs and table cells combined.
+        max_table_rows (int): Maximum number of table rows to keep.
+        use_lxml (bool): Use lxml's C parser when it is installed.
+
+    Returns:
+        dict: {'content': str, 'tables': list of rows}.
+    """
+    collector = ContentCollector(max_chars=max_chars, max_table_rows=max_table_rows)
+    if use_lxml and etree is not None:
+        parser = etree.HTMLParser(target=collector, recover=True)
+    else:
+        parser = _StdlibParser(collector)
+
+    for offset in range(0, len(html), CHUNK_SIZE):
+        parser.feed(html[offset:offset + CHUNK_SIZE])
+        if collector.done:
+            break
+
+    if not collector.done:
+        try:
+            parser.close()
+        except Exception:
+            # recovering parsers can still reject truncated documents; keep what was collected
+            pass
+    return collector.close()
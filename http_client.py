@@ -0,0 +1,166 @@
+import time
+import threading
+import concurrent.futures
+
+from collections import OrderedDict, defaultdict
+from urllib.parse import urlencode, urlsplit
+
+import requests
+
+from requests.adapters import HTTPAdapter
+from utils import inference_logger
+
+DEFAULT_HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/94.0.4606.61 Safari/537.3'}
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
+def iter_body(response, chunk_size=64 * 1024):
+    """yield body chunks as they arrive; iter_content waits for a full chunk, which hides a trickling server from the deadline"""
+    read1 = getattr(response.raw, "read1", None)
+    if read1 is None:
+        # urllib3 1.x has no read1
+        yield from response.iter_content(chunk_size=chunk_size)
+        return
+    while True:
+        chunk = read1(chunk_size, decode_content=True)
+        if not chunk:
+            return
+        yield chunk
+
+
+class HTTPClient:
+    """
+    Long-lived, connection-pooled HTTP client for the scraping tools.
+
+    Keeps TCP/TLS connections alive across tool calls, bounds concurrency per host,
+    applies connect/read timeouts plus an overall deadline, caps response size and
+    caches successful responses by URL for cache_ttl seconds. The cache holds at most
+    cache_size pages and cache_max_bytes of response bodies.
+    """
+
+    def __init__(self, pool_size=10, per_host_limit=4, connect_timeout=5, read_timeout=10,
+                 total_timeout=20, max_bytes=2 * 1024 * 1024, cache_ttl=300, cache_size=256,
+                 cache_max_bytes=32 * 1024 * 1024, headers=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_bytes = max_bytes
+        self.cache_ttl = cache_ttl
+        self.cache_size = cache_size
+        self.cache_max_bytes = cache_max_bytes
+
+        self.session = requests.Session()
+        self.session.headers.update(headers or DEFAULT_HEADERS)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="http-client")
+        self._host_limits = defaultdict(lambda: threading.BoundedSemaphore(per_host_limit))
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cache_key(url, params=None):
+        if params:
+            return f"{url}?{urlencode(sorted(params.items()))}"
+        return url
+
+    def _cache_get(self, key):
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, text, size = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                self._cache_bytes -= size
+                return None
+            self._cache.move_to_end(key)
+            return text
+
+    def _cache_put(self, key, text, size):
+        """size is the body length in bytes; bodies larger than the whole budget are not kept"""
+        if self.cache_ttl <= 0 or size > self.cache_max_bytes:
+            return
+        with self._lock:
+            previous = self._cache.pop(key, None)
+            if previous is not None:
+                self._cache_bytes -= previous[2]
+            self._cache[key] = (time.monotonic() + self.cache_ttl, text, size)
+            self._cache_bytes += size
+            while len(self._cache) > self.cache_size or self._cache_bytes > self.cache_max_bytes:
+                _, (_, _, evicted_size) = self._cache.popitem(last=False)
+                self._cache_bytes -= evicted_size
+
+    def _host_limit(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            return self._host_limits[host]
+
+    def get_text(self, url, params=None, truncate=True):
+        """fetch url and return its decoded body; bodies over max_bytes are cut off unless truncate is False"""
+        key = self.cache_key(url, params)
+        cached = self._cache_get(key)
+        if cached is not None:
+            inference_logger.info("HTTP cache hit: %s", key)
+            return cached
+
+        deadline = time.monotonic() + self.total_timeout
+        with self._host_limit(url):
+            with self.session.get(url, params=params, stream=True,
+                                  timeout=(self.connect_timeout, self.read_timeout)) as response:
+                response.raise_for_status()
+                chunks = []
+                size = 0
+                for chunk in iter_body(response):
+                    chunks.append(chunk)
+                    size += len(chunk)
+                    if size >= self.max_bytes:
+                        if not truncate:
+                            raise ResponseTooLarge(f"Response from {url} exceeds {self.max_bytes} bytes")
+                        inference_logger.info("Truncating response from %s at %d bytes", url, self.max_bytes)
+                        break
+                    if time.monotonic() > deadline:
+                        raise requests.Timeout(f"Fetching {url} took longer than {self.total_timeout}s")
+                body = b"".join(chunks)[:self.max_bytes]
+                text = body.decode(response.encoding or "utf-8", errors="replace")
+
+        self._cache_put(key, text, len(body))
+        return text
+
+    def fetch_many(self, urls):
+        """fetch urls concurrently on the shared pool, yielding (url, text) as they finish; failures yield None"""
+        futures = {self.executor.submit(self.get_text, url): url for url in urls}
+        for future in concurrent.futures.as_completed(futures):
+            url = futures[future]
+            try:
+                yield url, future.result()
+            except Exception as e:
+                inference_logger.info("Could not fetch %s: %s", url, e)
+                yield url, None
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
@@ -0,0 +1,226 @@
+import json
+import time
+import logging
+import threading
+import contextlib
+import contextvars
+
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# session/iteration labels attached to every span recorded in the current context
+_span_context = contextvars.ContextVar("span_context", default={})
+
+
+class Instrumentation:
+    """
+    Records timed spans for every stage of an agent iteration and fans them out to sinks.
+
+    A span is a flat dict with the stage name, its duration and stage-specific fields
+    such as token counts, tokens/s, time-to-first-token, memory and tool result sizes.
+    With no sinks attached recording is a no-op apart from the timer.
+    """
+
+    def __init__(self, sinks=None):
+        self.sinks = list(sinks or [])
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+        return sink
+
+    @contextlib.contextmanager
+    def context(self, **labels):
+        token = _span_context.set({**_span_context.get(), **labels})
+        try:
+            yield
+        finally:
+            _span_context.reset(token)
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        """time the block; the yielded dict can be filled with fields known only at the end"""
+        start = time.perf_counter()
+        try:
+            yield fields
+        except BaseException as e:
+            fields["error"] = type(e).__name__
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, **fields)
+
+    def record(self, name, duration, **fields):
+        if not self.sinks:
+            return
+        span = {"span": name, "timestamp": time.time(), "duration_s": duration, **_span_context.get(), **fields}
+        for sink in self.sinks:
+            sink.emit(span)
+
+
+class InMemorySink:
+    """keep spans in a list, for tests, notebooks and ad-hoc analysis"""
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def emit(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def totals(self):
+        """total seconds and call count per span name"""
+        totals = defaultdict(lambda: {"seconds": 0.0, "count": 0})
+        for span in self.spans:
+            totals[span["span"]]["seconds"] += span["duration_s"]
+            totals[span["span"]]["count"] += 1
+        return dict(totals)
+
+
+class JSONLSink:
+    """append one json line per span"""
+
+    def __init__(self, path):
+        self._file = open(path, 'a')
+        self._lock = threading.Lock()
+
+    def emit(self, span):
+        line = json.dumps(span, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusSink:
+    """aggregate spans into Prometheus text exposition format, optionally served over HTTP"""
+
+    COUNTER_FIELDS = ("prompt_tokens", "generated_tokens", "result_chars")
+    GAUGE_FIELDS = ("tokens_per_second", "time_to_first_token_s", "peak_memory_bytes", "kv_cache_bytes")
+
+    def __init__(self, prefix="hermes"):
+        self.prefix = prefix
+        self._seconds = defaultdict(float)
+        self._counts = defaultdict(int)
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._tool_cache = defaultdict(int)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def emit(self, span):
+        name = span["span"]
+        with self._lock:
+            self._seconds[name] += span["duration_s"]
+            self._counts[name] += 1
+            for field in self.COUNTER_FIELDS:
+                if isinstance(span.get(field), (int, float)):
+                    self._counters[(field, name)] += span[field]
+            for field in self.GAUGE_FIELDS:
+                if isinstance(span.get(field), (int, float)):
+                    self._gauges[(field, name)] = span[field]
+            if "cache" in span:
+                self._tool_cache[(span.get("tool"), span.get("cache_policy"), span["cache"])] += 1
+
+    def render(self):
+        p = self.prefix
+        with self._lock:
+            lines = [f"# TYPE {p}_span_seconds summary"]
+            for name in sorted(self._counts):
+                lines.append(f'{p}_span_seconds_sum{{span="{name}"}} {self._seconds[name]}')
+                lines.append(f'{p}_span_seconds_count{{span="{name}"}} {self._counts[name]}')
+            for field in self.COUNTER_FIELDS:
+                lines.append(f"# TYPE {p}_{field}_total counter")
+                lines.extend(f'{p}_{field}_total{{span="{name}"}} {value}'
+                             for (counter, name), value in sorted(self._counters.items()) if counter == field)
+            for field in self.GAUGE_FIELDS:
+                lines.append(f"# TYPE {p}_{field} gauge")
+                lines.extend(f'{p}_{field}{{span="{name}"}} {value}'
+                             for (gauge, name), value in sorted(self._gauges.items()) if gauge == field)
+            lines.append(f"# TYPE {p}_tool_cache_total counter")
+            lines.extend(f'{p}_tool_cache_total{{tool="{tool}",policy="{policy}",result="{result}"}} {value}'
+                         for (tool, policy, result), value in sorted(self._tool_cache.items(), key=str))
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = sink.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server.server_address
+
+
+class FirstTokenTimer:
+    """generate() streamer that notes when the first new token arrives, splitting prefill from decode"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at = None
+        self._prompt_seen = False
+
+    def put(self, value):
+        # the first put is the prompt itself
+        if not self._prompt_seen:
+            self._prompt_seen = True
+        elif self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    def end(self):
+        pass
+
+
+def reset_peak_memory(device):
+    import torch
+    if getattr(device, "type", device) == "cuda":
+        torch.cuda.reset_peak_memory_stats(device)
+
+
+def peak_memory_bytes(device):
+    """peak allocated accelerator memory, or the process peak RSS on CPU"""
+    import torch
+    if getattr(device, "type", device) == "cuda":
+        return torch.cuda.max_memory_allocated(device)
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return None
+
+
+def kv_cache_bytes(config, num_sequences, sequence_length, dtype_bytes):
+    """size of the key/value cache for the given batch, from the model config"""
+    num_layers = getattr(config, "num_hidden_layers", None)
+    num_heads = getattr(config, "num_attention_heads", None)
+    hidden_size = getattr(config, "hidden_size", None)
+    if not (num_layers and num_heads and hidden_size):
+        return None
+    num_kv_heads = getattr(config, "num_key_value_heads", None) or num_heads
+    head_dim = getattr(config, "head_dim", None) or hidden_size // num_heads
+    return 2 * num_layers * num_kv_heads * head_dim * num_sequences * sequence_length * dtype_bytes
+
+
+def build_instrumentation(metrics_jsonl=None, metrics_port=None):
+    """instrumentation with the sinks selected on the command line"""
+    instrumentation = Instrumentation()
+    if metrics_jsonl:
+        instrumentation.add_sink(JSONLSink(metrics_jsonl))
+    if metrics_port:
+        host, port = instrumentation.add_sink(PrometheusSink()).serve(metrics_port)
+        logging.getLogger("function-calling-inference").info("Serving Prometheus metrics on http://%s:%s/metrics", host, port)
+    return instrumentation
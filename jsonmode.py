@@ -1,13 +1,29 @@
 import argparse
-import torch
+
+from daemon import serve_from_daemon
+
+# options a running daemon honors; the full parser in __main__ extends them
+client_parser = argparse.ArgumentParser(add_help=False)
+client_parser.add_argument("--model_path", type=str, help="Path to the model folder")
+client_parser.add_argument("--chat_template", type=str, default="chatml", help="Chat template for prompt formatting")
+client_parser.add_argument("--query", type=str, default="Please return a json object to represent Goku from the anime Dragon Ball Z?")
+client_parser.add_argument("--max_depth", type=int, default=5, help="Maximum number of recursive iteration")
+client_parser.add_argument("--daemon_socket", type=str, default=None, help="Socket of a running daemon.py --mode json (default: hermes-json.sock in the temp dir)")
+client_parser.add_argument("--no_daemon", action="store_true", help="Always load the model in this process instead of using a running daemon")
+
+if __name__ == "__main__":
+    # hand the query to a running daemon before paying for torch and transformers
+    serve_from_daemon("json", client_parser, lambda args: {
+        "query": args.query, "model_path": args.model_path, "chat_template": args.chat_template, "max_depth": args.max_depth,
+    })
+
 import json
 
-from transformers import (
-    AutoModelForCausalLM,
-    AutoTokenizer,
-    BitsAndBytesConfig
-)
+from transformers import AutoTokenizer
 
+from model_loader import load_model, add_model_arguments, model_options, left_pad_batch, decode_batch
+from completion_cache import add_cache_arguments, setup_completion_cache
+from speculative import add_speculative_arguments, setup_speculative_decoding
 from validator import validate_json_data
 
 from utils import (
@@ -15,7 +31,8 @@ from utils import (
     inference_logger,
     get_assistant_message,
     get_chat_template,
-    validate_and_extract_tool_calls
+    validate_and_extract_tool_calls,
+    LogPayload
 )
 
 # create your pydantic model for json object here
@@ -38,26 +55,30 @@ class Character(BaseModel):
 pydantic_schema = Character.schema_json()
 
 class ModelInference:
-    def __init__(self, model_path, chat_template, load_in_4bit):
+    def __init__(self, model_path, chat_template, load_in_4bit="False", device="auto", precision="auto",
+                 attn_implementation="auto", compile_model=False, num_threads=None,
+                 mmap_weights=False):
         inference_logger.info(print_nous_text_art())
-        self.bnb_config = None
-
-        if load_in_4bit == "True":
-            self.bnb_config = BitsAndBytesConfig(
-                load_in_4bit=True,
-                bnb_4bit_quant_type="nf4",
-                bnb_4bit_use_double_quant=True,
-            )
-        self.model = AutoModelForCausalLM.from_pretrained(
+        self.model = load_model(
             model_path,
-            trust_remote_code=True,
-            return_dict=True,
-            quantization_config=self.bnb_config,
-            torch_dtype=torch.float16,
-            attn_implementation="flash_attention_2",
-            device_map="auto",
+            device=device,
+            precision=precision,
+            attn_implementation=attn_implementation,
+            compile_model=compile_model,
+            num_threads=num_threads,
+            load_in_4bit=load_in_4bit,
+            mmap_weights=mmap_weights,
         )
 
+        self.completion_cache = None
+        self.speculative = None
+        self.generation_kwargs = {
+            "max_new_tokens": 1500,
+            "temperature": 0.8,
+            "repetition_penalty": 1.1,
+            "do_sample": True,
+        }
+
         self.tokenizer = AutoTokenizer.from_pretrained(model_path, trust_remote_code=True)
         self.tokenizer.pad_token = self.tokenizer.eos_token
         self.tokenizer.padding_side = "left"
@@ -77,25 +98,52 @@ class ModelInference:
             return_tensors='pt'
         )
 
+        cache_key = None
+        if self.completion_cache is not None and self.completion_cache.enabled_for(self.generation_kwargs):
+            cache_key = self.completion_cache.key(self.model, self.generation_kwargs, inputs[0].tolist())
+            cached = self.completion_cache.get(cache_key)
+            if cached is not None:
+                return cached[0]
+
+        speculative_kwargs = self.speculative.generate_kwargs() if self.speculative is not None else {}
         tokens = self.model.generate(
             inputs.to(self.model.device),
-            max_new_tokens=1500,
-            temperature=0.8,
-            repetition_penalty=1.1,
-            do_sample=True,
-            eos_token_id=self.tokenizer.eos_token_id
+            eos_token_id=self.tokenizer.eos_token_id,
+            **speculative_kwargs,
+            **self.generation_kwargs
         )
+        if speculative_kwargs and "max_new_tokens" in self.generation_kwargs:
+            # the last accepted draft can run past max_new_tokens
+            tokens = tokens[:, :inputs.shape[-1] + self.generation_kwargs["max_new_tokens"]]
         completion = self.tokenizer.decode(tokens[0], skip_special_tokens=False, clean_up_tokenization_space=True)
+        if cache_key is not None:
+            self.completion_cache.put(cache_key, [completion])
         return completion
 
-    def generate_json_completion(self, query, chat_template, max_depth=5):
+    def tokenize_prompt(self, prompt):
+        return self.tokenizer.apply_chat_template(prompt, add_generation_prompt=True)
+
+    def generate_batch(self, batch_input_ids):
+        """left-pad tokenized prompts and generate them in one call"""
+        pad_token_id = self.tokenizer.pad_token_id
+        input_ids, attention_mask = left_pad_batch(batch_input_ids, pad_token_id)
+        tokens = self.model.generate(
+            input_ids=input_ids.to(self.model.device),
+            attention_mask=attention_mask.to(self.model.device),
+            eos_token_id=self.tokenizer.eos_token_id,
+            pad_token_id=pad_token_id,
+            **self.generation_kwargs
+        )
+        return decode_batch(self.tokenizer, tokens, batch_input_ids, pad_token_id)
+
+    def generate_json_completion(self, query, chat_template, max_depth=5, on_event=None):
         try:
             depth = 0
             sys_prompt = f"You are a helpful assistant that answers in JSON. Here's the json schema you must adhere to:\n<schema>\n{pydantic_schema}\n</schema>"
             prompt = [{"role": "system", "content": sys_prompt}]
             prompt.append({"role": "user", "content": query})
 
-            inference_logger.info(f"Running inference to generate json object for pydantic schema:\n{json.dumps(json.loads(pydantic_schema), indent=2)}")
+            inference_logger.info("Running inference to generate json object for pydantic schema:\n%s", LogPayload(pydantic_schema))
             completion = self.run_inference(prompt)
 
             def recursive_loop(prompt, completion, depth):
@@ -106,13 +154,19 @@ class ModelInference:
                 tool_message = f"Agent iteration {depth} to assist with user query: {query}\n"
                 if assistant_message is not None:
                     validation, json_object, error_message = validate_json_data(assistant_message, json.loads(pydantic_schema))
+                    if on_event is not None:
+                        # stream the turn to the caller, e.g. a daemon client
+                        on_event({"event": "assistant", "iteration": depth, "content": assistant_message})
+                        on_event({"event": "json_object", "iteration": depth, "object": json_object, "valid": validation})
+                        if error_message:
+                            on_event({"event": "validation_error", "iteration": depth, "message": error_message})
                     if validation:
-                        inference_logger.info(f"Assistant Message:\n{assistant_message}")
-                        inference_logger.info(f"json schema validation passed")
-                        inference_logger.info(f"parsed json object:\n{json.dumps(json_object, indent=2)}")
+                        inference_logger.info("Assistant Message:\n%s", LogPayload(assistant_message))
+                        inference_logger.info("json schema validation passed")
+                        inference_logger.info("parsed json object:\n%s", LogPayload(json_object, indent=2))
                     elif error_message:
-                        inference_logger.info(f"Assistant Message:\n{assistant_message}")
-                        inference_logger.info(f"json schema validation failed")
+                        inference_logger.info("Assistant Message:\n%s", LogPayload(assistant_message))
+                        inference_logger.info("json schema validation failed")
                         tool_message += f"<tool_response>\nJson schema validation failed\nHere's the error stacktrace: {error_message}\nPlease return corrrect json object\n<tool_response>"
                         
                         depth += 1
@@ -127,24 +181,30 @@ class ModelInference:
                     inference_logger.warning("Assistant message is None")
             recursive_loop(prompt, completion, depth)
         except Exception as e:
-            inference_logger.error(f"Exception occurred: {e}")
+            inference_logger.error("Exception occurred: %s", e)
             raise e
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Run json mode completion")
-    parser.add_argument("--model_path", type=str, help="Path to the model folder")
-    parser.add_argument("--chat_template", type=str, default="chatml", help="Chat template for prompt formatting")
+    parser = argparse.ArgumentParser(description="Run json mode completion", parents=[client_parser])
     parser.add_argument("--load_in_4bit", type=str, default="False", help="Option to load in 4bit with bitsandbytes")
-    parser.add_argument("--query", type=str, default="Please return a json object to represent Goku from the anime Dragon Ball Z?")
-    parser.add_argument("--max_depth", type=int, default=5, help="Maximum number of recursive iteration")
+    add_model_arguments(parser)
+    add_cache_arguments(parser)
+    add_speculative_arguments(parser)
     args = parser.parse_args()
 
     # specify custom model path
     if args.model_path:
-        inference = ModelInference(args.model_path, args.chat_template, args.load_in_4bit)
+        inference = ModelInference(args.model_path, args.chat_template, args.load_in_4bit, **model_options(args))
     else:
         model_path = 'NousResearch/Hermes-2-Pro-Llama-3-8B'
-        inference = ModelInference(model_path, args.chat_template, args.load_in_4bit)
+        inference = ModelInference(model_path, args.chat_template, args.load_in_4bit, **model_options(args))
         
+    completion_cache = setup_completion_cache(inference, args)
+    speculative = setup_speculative_decoding(inference, args, model_options(args))
+
     # Run the model evaluator
     inference.generate_json_completion(args.query, args.chat_template, args.max_depth)
+    if completion_cache is not None:
+        inference_logger.info("Completion cache: %s", completion_cache.stats())
+    if speculative is not None:
+        inference_logger.info("Speculative decoding: %s", speculative.stats())
@@ -0,0 +1,237 @@
+import os
+import ast
+import json
+import argparse
+
+from collections import OrderedDict, deque
+
+from jsonmode import ModelInference, pydantic_schema
+from validator import get_schema_validator
+from model_loader import add_model_arguments, model_options
+from utils import (
+    inference_logger,
+    get_assistant_message,
+    extract_json_from_markdown
+)
+
+
+def read_documents(input_path, id_field="id", text_field="text"):
+    """stream (doc_id, text, error) from a JSONL file or from the .txt/.md files of a folder"""
+    if os.path.isdir(input_path):
+        for name in sorted(os.listdir(input_path)):
+            if name.endswith((".txt", ".md")):
+                with open(os.path.join(input_path, name), 'r', encoding='utf-8', errors='replace') as file:
+                    yield name, file.read(), None
+        return
+
+    with open(input_path, 'r') as file:
+        for line_number, line in enumerate(file):
+            line = line.strip()
+            if not line:
+                continue
+            error = None
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                record, error = None, f"Could not decode record: {e}"
+            if error is None and not isinstance(record, dict):
+                error = f"Record is not a json object ({type(record).__name__})"
+            if error is not None:
+                # no id to read, so name the line; a line number alone could clash with a real id
+                record = {id_field: f"line {line_number + 1}"}
+            elif not isinstance(record.get(text_field), str):
+                error = f"Record has no text in its {text_field} field"
+            yield str(record.get(id_field, line_number)), record.get(text_field), error
+
+
+def parse_json_object(text):
+    """decode a json object from an assistant message with the same fallbacks as validate_json_data"""
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    try:
+        return ast.literal_eval(text)
+    except (SyntaxError, ValueError):
+        return extract_json_from_markdown(text)
+
+
+def is_empty(value):
+    return value is None or value == "" or value == [] or value == {}
+
+
+def merge_objects(merged, update):
+    """fold the object extracted from one chunk into the document result"""
+    if isinstance(merged, dict) and isinstance(update, dict):
+        for key, value in update.items():
+            if key not in merged or is_empty(merged[key]):
+                merged[key] = value
+            else:
+                merged[key] = merge_objects(merged[key], value)
+        return merged
+    if isinstance(merged, list) and isinstance(update, list):
+        seen = {json.dumps(item, sort_keys=True, default=str) for item in merged}
+        for item in update:
+            key = json.dumps(item, sort_keys=True, default=str)
+            if key not in seen:
+                seen.add(key)
+                merged.append(item)
+        return merged
+    # conflicting scalars: keep the value from the earliest chunk
+    return merged
+
+
+class DocumentState:
+    def __init__(self, doc_id, num_chunks):
+        self.doc_id = doc_id
+        self.num_chunks = num_chunks
+        self.results = {}
+        self.chunk_errors = []
+
+
+class BulkExtractor:
+    """
+    Extract schema-conforming json records from a stream of documents.
+
+    Documents longer than the context window are split into overlapping token
+    chunks, chunks from several documents are generated together, and per-chunk
+    objects are merged and validated once all chunks of a document are back.
+    Only max_in_flight_docs documents are held in memory at a time and each
+    record is written as soon as its document is complete.
+    """
+
+    def __init__(self, inference, json_schema, chat_template, batch_size=8, max_context=None,
+                 chunk_overlap=64, max_in_flight_docs=None):
+        self.inference = inference
+        self.tokenizer = inference.tokenizer
+        self.json_schema = json_schema
+        self.chat_template = chat_template
+        self.batch_size = batch_size
+        self.chunk_overlap = chunk_overlap
+        self.max_in_flight_docs = max_in_flight_docs or 2 * batch_size
+        self.validator = get_schema_validator(json_schema)
+        self.sys_prompt = f"You are a helpful assistant that answers in JSON. Here's the json schema you must adhere to:\n<schema>\n{json.dumps(json_schema)}\n</schema>"
+
+        max_context = max_context or getattr(inference.model.config, "max_position_embeddings", 4096)
+        prompt_overhead = len(inference.tokenize_prompt(self.build_prompt("", 1, 1))) + 32
+        self.chunk_tokens = max_context - prompt_overhead - inference.generation_kwargs["max_new_tokens"]
+        if self.chunk_tokens <= chunk_overlap:
+            raise ValueError(f"Context of {max_context} tokens leaves no room for document chunks")
+
+    def build_prompt(self, text, part, num_parts):
+        if num_parts > 1:
+            query = f"Extract a json object from part {part} of {num_parts} of the following document. Only include information found in this part.\n<document>\n{text}\n</document>"
+        else:
+            query = f"Extract a json object from the following document.\n<document>\n{text}\n</document>"
+        return [
+            {"role": "system", "content": self.sys_prompt},
+            {"role": "user", "content": query},
+        ]
+
+    def split_document(self, text):
+        token_ids = self.tokenizer(text, add_special_tokens=False)["input_ids"]
+        step = self.chunk_tokens - self.chunk_overlap
+        starts = range(0, max(len(token_ids) - self.chunk_overlap, 1), step)
+        return [self.tokenizer.decode(token_ids[start:start + self.chunk_tokens]) for start in starts]
+
+    def finish_document(self, state, output, error=None):
+        merged = None
+        for index in sorted(state.results):
+            merged = state.results[index] if merged is None else merge_objects(merged, state.results[index])
+
+        if error is not None:
+            errors = [error]
+        elif merged is not None:
+            errors = [error.message for error in self.validator.iter_errors(merged)]
+        else:
+            errors = ["No json object extracted"]
+        record = {
+            "id": state.doc_id,
+            "object": merged,
+            "valid": not errors,
+            "errors": errors,
+            "num_chunks": state.num_chunks,
+            "chunk_errors": state.chunk_errors,
+        }
+        output.write(json.dumps(record, default=str) + "\n")
+        output.flush()
+        return record["valid"]
+
+    def run(self, documents, output_path):
+        documents = iter(documents)
+        pending_chunks = deque()
+        in_flight = OrderedDict()
+        stats = {"documents": 0, "chunks": 0, "valid": 0}
+        exhausted = False
+        # keyed by input position so repeated ids in the input stay separate documents
+        position = 0
+
+        with open(output_path, 'w') as output:
+            while True:
+                # admit documents until there is a full batch of chunks or the memory bound is hit
+                while not exhausted and len(pending_chunks) < self.batch_size and len(in_flight) < self.max_in_flight_docs:
+                    document = next(documents, None)
+                    if document is None:
+                        exhausted = True
+                        break
+                    doc_id, text, error = document
+                    if error is not None:
+                        # a bad record gets its error entry instead of stopping the run
+                        self.finish_document(DocumentState(doc_id, 0), output, error=error)
+                        stats["documents"] += 1
+                        continue
+                    chunks = self.split_document(text)
+                    in_flight[position] = DocumentState(doc_id, len(chunks))
+                    for index, chunk in enumerate(chunks):
+                        prompt = self.build_prompt(chunk, index + 1, len(chunks))
+                        pending_chunks.append((position, index, self.inference.tokenize_prompt(prompt)))
+                    position += 1
+
+                if not pending_chunks:
+                    break
+
+                batch = [pending_chunks.popleft() for _ in range(min(self.batch_size, len(pending_chunks)))]
+                completions, _ = self.inference.generate_batch([input_ids for _, _, input_ids in batch])
+                stats["chunks"] += len(batch)
+
+                for (document_position, index, _), completion in zip(batch, completions):
+                    state = in_flight[document_position]
+                    assistant_message = get_assistant_message(completion, self.chat_template, self.tokenizer.eos_token)
+                    json_object = parse_json_object(assistant_message) if assistant_message else None
+                    if json_object is None:
+                        state.chunk_errors.append(f"chunk {index + 1}: could not decode a json object")
+                    else:
+                        state.results[index] = json_object
+
+                    if len(state.results) + len(state.chunk_errors) == state.num_chunks:
+                        stats["valid"] += self.finish_document(in_flight.pop(document_position), output)
+                        stats["documents"] += 1
+
+        inference_logger.info("Bulk extraction finished: %s", stats)
+        return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run json mode extraction over a stream of documents")
+    parser.add_argument("--input", type=str, required=True, help="JSONL file with id/text records or a folder of .txt files")
+    parser.add_argument("--output", type=str, required=True, help="JSONL file for the extracted records")
+    parser.add_argument("--schema_path", type=str, default=None, help="JSON schema file (default: the Character schema in jsonmode.py)")
+    parser.add_argument("--model_path", type=str, default='NousResearch/Hermes-2-Pro-Llama-3-8B', help="Path to the model folder")
+    parser.add_argument("--chat_template", type=str, default="chatml", help="Chat template for prompt formatting")
+    parser.add_argument("--load_in_4bit", type=str, default="False", help="Option to load in 4bit with bitsandbytes")
+    parser.add_argument("--batch_size", type=int, default=8, help="Number of chunks generated together")
+    parser.add_argument("--max_context", type=int, default=None, help="Context window in tokens (default: from the model config)")
+    parser.add_argument("--chunk_overlap", type=int, default=64, help="Tokens shared by consecutive chunks of a document")
+    parser.add_argument("--text_field", type=str, default="text", help="Record field holding the document text")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    if args.schema_path:
+        with open(args.schema_path, 'r') as file:
+            json_schema = json.load(file)
+    else:
+        json_schema = json.loads(pydantic_schema)
+
+    inference = ModelInference(args.model_path, args.chat_template, args.load_in_4bit, **model_options(args))
+    extractor = BulkExtractor(inference, json_schema, args.chat_template, args.batch_size, args.max_context, args.chunk_overlap)
+    extractor.run(read_documents(args.input, text_field=args.text_field), args.output)
@@ -0,0 +1,241 @@
+import os
+import json
+import mmap
+import struct
+import importlib.util
+
+import torch
+
+from transformers import AutoConfig, AutoModelForCausalLM, BitsAndBytesConfig
+
+from utils import inference_logger
+
+PRECISIONS = ["auto", "fp16", "bf16", "fp32", "int8", "4bit"]
+ATTN_IMPLEMENTATIONS = ["auto", "flash_attention_2", "sdpa", "eager"]
+TORCH_DTYPES = {"fp16": torch.float16, "bf16": torch.bfloat16, "fp32": torch.float32}
+DTYPE_PRECISIONS = {dtype: precision for precision, dtype in TORCH_DTYPES.items()}
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+    "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+    "U8": torch.uint8, "BOOL": torch.bool,
+}
+
+
+def resolve_device(device="auto"):
+    if device == "auto":
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    return device
+
+
+def resolve_precision(precision, device, load_in_4bit=False):
+    # load_in_4bit predates --precision and is still accepted as "True"/"False"
+    if load_in_4bit in (True, "True"):
+        return "4bit"
+    if precision == "auto":
+        return "fp16" if device.startswith("cuda") else "fp32"
+    return precision
+
+
+def resolve_attn_implementation(attn_implementation, device):
+    if attn_implementation == "auto":
+        if device.startswith("cuda") and importlib.util.find_spec("flash_attn") is not None:
+            return "flash_attention_2"
+        return "sdpa"
+    return attn_implementation
+
+
+def safetensors_files(model_path):
+    index_path = os.path.join(model_path, "model.safetensors.index.json")
+    if os.path.exists(index_path):
+        with open(index_path, 'r') as file:
+            shards = sorted(set(json.load(file)["weight_map"].values()))
+        return [os.path.join(model_path, shard) for shard in shards]
+    single = os.path.join(model_path, "model.safetensors")
+    if os.path.exists(single):
+        return [single]
+    raise FileNotFoundError(f"No safetensors weights in {model_path}; memory-mapped loading needs a local safetensors checkpoint")
+
+
+def mmap_safetensors(path):
+    """
+    Map a safetensors file and return its tensors as views over the mapping.
+
+    The mapping is private copy-on-write, so as long as weights are only read every
+    process mapping the same file shares the same page-cache pages.
+    """
+    with open(path, 'rb') as file:
+        (header_size,) = struct.unpack("<Q", file.read(8))
+        header = json.loads(file.read(header_size))
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    tensors = {}
+    for name, info in header.items():
+        if name == "__metadata__":
+            continue
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        if end == start:
+            tensors[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = (end - start) // dtype.itemsize
+        tensors[name] = torch.frombuffer(buffer, dtype=dtype, count=count, offset=data_start + start).view(info["shape"])
+    return tensors
+
+
+def load_mmap_model(model_path, precision="auto", attn_implementation="sdpa"):
+    """build the model without allocating weights and point its parameters at memory-mapped safetensors"""
+    from accelerate import init_empty_weights
+
+    state_dict = {}
+    for path in safetensors_files(model_path):
+        state_dict.update(mmap_safetensors(path))
+
+    stored_dtype = next(tensor.dtype for tensor in state_dict.values() if tensor.is_floating_point())
+    dtype = stored_dtype if precision == "auto" else TORCH_DTYPES[precision]
+    if dtype != stored_dtype:
+        inference_logger.warning("Weights are stored as %s; casting to %s copies them and they are no longer shared", stored_dtype, dtype)
+        state_dict = {name: tensor.to(dtype) if tensor.is_floating_point() else tensor for name, tensor in state_dict.items()}
+
+    config = AutoConfig.from_pretrained(model_path, trust_remote_code=True)
+    # buffers such as rotary frequencies are not in the checkpoint, so only parameters go on the meta device
+    with init_empty_weights(include_buffers=False):
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=dtype, attn_implementation=attn_implementation, trust_remote_code=True)
+    model.load_state_dict(state_dict, strict=False, assign=True)
+    model.tie_weights()
+
+    missing = [name for name, param in model.named_parameters() if param.is_meta]
+    if missing:
+        raise ValueError(f"Checkpoint in {model_path} has no weights for {missing[:5]}")
+    return model
+
+
+def load_model(model_path, device="auto", precision="auto", attn_implementation="auto",
+               compile_model=False, num_threads=None, load_in_4bit=False, mmap_weights=False):
+    """
+    Load a causal LM for inference on GPU or CPU.
+
+    Args:
+        model_path (str): Hub id or local folder of the model.
+        device (str): "auto", "cuda" or "cpu".
+        precision (str): "auto" (fp16 on GPU, fp32 on CPU), "fp16", "bf16", "fp32",
+            "int8" (dynamic int8 quantization of linear layers, CPU only) or "4bit" (bitsandbytes, GPU only).
+        attn_implementation (str): "auto" (flash_attention_2 when installed on GPU, otherwise sdpa),
+            "flash_attention_2", "sdpa" or "eager".
+        compile_model (bool): Compile the forward pass with torch.compile.
+        num_threads (int): Intra-op threads used by torch on CPU.
+        load_in_4bit (str): Legacy "True"/"False" switch, same as precision="4bit".
+        mmap_weights (bool): Use the safetensors files as memory-mapped weights instead of
+            copying them, so processes loading the same checkpoint share one copy (CPU only).
+
+    Returns:
+        The model in eval mode.
+    """
+    device = resolve_device(device)
+    requested_precision = precision
+    precision = resolve_precision(precision, device, load_in_4bit)
+    attn_implementation = resolve_attn_implementation(attn_implementation, device)
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision {precision}, expected one of {PRECISIONS}")
+    if precision == "4bit" and not device.startswith("cuda"):
+        raise ValueError("4bit loading uses bitsandbytes and needs a CUDA device; use --precision int8 on CPU")
+    if precision == "int8" and device != "cpu":
+        raise ValueError("Dynamic int8 quantization runs on CPU only")
+    if mmap_weights and (device != "cpu" or precision in ("int8", "4bit")):
+        raise ValueError("Memory-mapped weights need device cpu and an unquantized precision")
+
+    if num_threads:
+        torch.set_num_threads(num_threads)
+
+    if mmap_weights:
+        inference_logger.info("Mapping weights of %s with attn_implementation=%s threads=%s",
+                              model_path, attn_implementation, torch.get_num_threads())
+        # keep the stored dtype unless a precision is asked for explicitly
+        model = load_mmap_model(model_path, requested_precision, attn_implementation)
+        model.eval()
+        if compile_model:
+            model.forward = torch.compile(model.forward, dynamic=True)
+        model.load_options = {"precision": DTYPE_PRECISIONS.get(model.dtype, str(model.dtype)), "attn_implementation": attn_implementation, "compile_model": compile_model}
+        return model
+
+    kwargs = {
+        "trust_remote_code": True,
+        "return_dict": True,
+        "attn_implementation": attn_implementation,
+    }
+    if precision == "4bit":
+        kwargs["quantization_config"] = BitsAndBytesConfig(
+            load_in_4bit=True,
+            bnb_4bit_quant_type="nf4",
+            bnb_4bit_use_double_quant=True,
+        )
+        kwargs["torch_dtype"] = torch.float16
+    else:
+        # int8 dynamic quantization starts from fp32 weights
+        kwargs["torch_dtype"] = TORCH_DTYPES.get(precision, torch.float32)
+    if device.startswith("cuda"):
+        kwargs["device_map"] = "auto"
+
+    inference_logger.info("Loading %s on %s with precision=%s attn_implementation=%s threads=%s",
+                          model_path, device, precision, attn_implementation, torch.get_num_threads())
+    model = AutoModelForCausalLM.from_pretrained(model_path, **kwargs)
+    if not device.startswith("cuda"):
+        model.to(device)
+    model.eval()
+
+    if precision == "int8":
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    if compile_model:
+        # dynamic shapes avoid a recompile for every new prompt length
+        model.forward = torch.compile(model.forward, dynamic=True)
+
+    # int8 and 4bit models still report a float dtype, so keep what was loaded for cache keys
+    model.load_options = {"precision": precision, "attn_implementation": attn_implementation, "compile_model": compile_model}
+    return model
+
+
+def left_pad_batch(batch_input_ids, pad_token_id):
+    """left-pad tokenized prompts of different lengths into input_ids and attention_mask for one generate call"""
+    max_length = max(len(input_ids) for input_ids in batch_input_ids)
+    input_ids = torch.full((len(batch_input_ids), max_length), pad_token_id, dtype=torch.long)
+    attention_mask = torch.zeros_like(input_ids)
+    for row, ids in enumerate(batch_input_ids):
+        input_ids[row, max_length - len(ids):] = torch.tensor(ids, dtype=torch.long)
+        attention_mask[row, max_length - len(ids):] = 1
+    return input_ids, attention_mask
+
+
+def decode_batch(tokenizer, tokens, batch_input_ids, pad_token_id):
+    """decode each row of a left-padded generate output; returns the completions and generated token counts"""
+    max_length = max(len(input_ids) for input_ids in batch_input_ids)
+    completions = []
+    num_generated_tokens = []
+    for row, ids in enumerate(batch_input_ids):
+        sequence = tokens[row, max_length - len(ids):]
+        completions.append(tokenizer.decode(sequence, skip_special_tokens=False, clean_up_tokenization_space=True))
+        num_generated_tokens.append(int((tokens[row, max_length:] != pad_token_id).sum()))
+    return completions, num_generated_tokens
+
+
+def add_model_arguments(parser):
+    """command line options for load_model shared by the inference scripts"""
+    parser.add_argument("--device", type=str, default="auto", help="Device to run on: auto, cuda or cpu")
+    parser.add_argument("--precision", type=str, default="auto", choices=PRECISIONS, help="Weight precision; int8 is dynamic quantization on CPU, 4bit is bitsandbytes on GPU")
+    parser.add_argument("--attn_implementation", type=str, default="auto", choices=ATTN_IMPLEMENTATIONS, help="Attention kernel (default: flash_attention_2 when available on GPU, otherwise sdpa)")
+    parser.add_argument("--compile", action="store_true", help="Compile the model forward pass with torch.compile")
+    parser.add_argument("--num_threads", type=int, default=None, help="Torch intra-op threads for CPU inference")
+    parser.add_argument("--mmap_weights", action="store_true", help="Use memory-mapped safetensors weights shared between processes (CPU only)")
+    return parser
+
+
+def model_options(args):
+    """keyword arguments for ModelInference from add_model_arguments options"""
+    return {
+        "device": args.device,
+        "precision": args.precision,
+        "attn_implementation": args.attn_implementation,
+        "compile_model": args.compile,
+        "num_threads": args.num_threads,
+        "mmap_weights": args.mmap_weights,
+    }
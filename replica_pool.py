@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import queue
+import pickle
+import atexit
+import logging
+import argparse
+import threading
+import subprocess
+import concurrent.futures
+
+from collections import OrderedDict
+
+from framing import read_frame, write_frame
+
+# workers run this file as a script; utils is only imported once the channel is set up
+inference_logger = logging.getLogger("function-calling-inference")
+
+
+class ReplicaWorker:
+    """a model replica in its own process, serving requests one at a time over a pipe"""
+
+    def __init__(self, index, config, on_done, lock):
+        self.index = index
+        self.config = config
+        self.on_done = on_done
+        # the pool's lock; requests are only queued to a worker while holding it
+        self.lock = lock
+        self.in_flight = 0
+        self.completed = 0
+        self.sessions = set()
+        self.alive = True
+        self._requests = queue.Queue()
+
+        env = dict(os.environ)
+        # RotatingFileHandler is not safe across processes, so each replica logs to its own file
+        env["HFC_LOG_FILE"] = f"function-calling-inference.replica-{index}.log"
+        threads = str(config["model_options"]["num_threads"])
+        for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS"):
+            env[var] = threads
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+        self._thread = threading.Thread(target=self._serve, name=f"replica-{index}", daemon=True)
+        self._thread.start()
+
+    def submit(self, request, future):
+        self._requests.put((request, future))
+
+    def _serve(self):
+        channel = self.process.stdout.fileno()
+        try:
+            read_frame(channel, time.monotonic() + self.config["startup_timeout"])
+        except Exception as e:
+            inference_logger.error("Replica %d failed to start: %s", self.index, e)
+            self._fail(e)
+            return
+
+        while True:
+            item = self._requests.get()
+            if item is None:
+                return
+            request, future = item
+            try:
+                write_frame(self.process.stdin, pickle.dumps(request))
+                response = pickle.loads(read_frame(channel))
+            except Exception as e:
+                inference_logger.error("Replica %d died: %s", self.index, e)
+                future.set_exception(RuntimeError(f"replica {self.index} died: {e}"))
+                self.on_done(self)
+                self._fail(e)
+                return
+            if "error" in response:
+                future.set_exception(RuntimeError(response["error"]))
+            else:
+                future.set_result(response["result"])
+            self.completed += 1
+            self.on_done(self)
+
+    def _fail(self, error):
+        # under the pool lock, so no request is routed here after the queue is drained
+        pending = []
+        with self.lock:
+            self.alive = False
+            while True:
+                try:
+                    item = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    pending.append(item)
+        self.kill()
+        for request, future in pending:
+            future.set_exception(RuntimeError(f"replica {self.index} is unavailable: {error}"))
+            self.on_done(self)
+
+    def close(self):
+        self._requests.put(None)
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            self.kill()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+class ReplicaPool:
+    """
+    Run the function calling loop on several model replicas in separate processes.
+
+    Replicas load the checkpoint as memory-mapped safetensors, so the weights are
+    held in memory once however many workers run. New sessions go to the worker with
+    the fewest requests in flight and later queries of a session are sent to the same
+    worker, which keeps the conversation history of its sessions.
+    """
+
+    def __init__(self, model_path, num_workers=None, threads_per_worker=None, chat_template="chatml",
+                 model_options=None, max_sessions_per_worker=256, startup_timeout=600):
+        num_workers = num_workers or max((os.cpu_count() or 1) // 4, 1)
+        threads_per_worker = threads_per_worker or max((os.cpu_count() or 1) // num_workers, 1)
+        model_options = dict(model_options or {}, device="cpu", mmap_weights=True, num_threads=threads_per_worker)
+        self.config = {
+            "model_path": model_path,
+            "chat_template": chat_template,
+            "model_options": model_options,
+            "max_sessions": max_sessions_per_worker,
+            "startup_timeout": startup_timeout,
+        }
+        self._lock = threading.Lock()
+        self._sticky = {}
+        self.workers = [ReplicaWorker(index, self.config, self._done, self._lock) for index in range(num_workers)]
+
+    def _done(self, worker):
+        with self._lock:
+            worker.in_flight -= 1
+
+    def _route(self, session_id, request, future):
+        with self._lock:
+            worker = self._sticky.get(session_id)
+            if worker is None or not worker.alive:
+                alive = [worker for worker in self.workers if worker.alive]
+                if not alive:
+                    raise RuntimeError("No model replica is available")
+                worker = min(alive, key=lambda worker: (worker.in_flight, len(worker.sessions)))
+                if session_id is not None:
+                    self._sticky[session_id] = worker
+                    worker.sessions.add(session_id)
+            worker.in_flight += 1
+            worker.submit(request, future)
+
+    def submit(self, query, session_id=None, num_fewshot=None, max_depth=5, **kwargs):
+        """queue a query and return a future with the conversation; session_id continues an earlier one"""
+        request = {"op": "generate_function_call", "session_id": session_id, "query": query,
+                   "num_fewshot": num_fewshot, "max_depth": max_depth, "kwargs": kwargs}
+        future = concurrent.futures.Future()
+        self._route(session_id, request, future)
+        return future
+
+    def generate_function_call(self, query, session_id=None, **kwargs):
+        return self.submit(query, session_id, **kwargs).result()
+
+    def end_session(self, session_id):
+        with self._lock:
+            worker = self._sticky.pop(session_id, None)
+            if worker is None:
+                return
+            worker.sessions.discard(session_id)
+            if not worker.alive:
+                return
+            worker.in_flight += 1
+            worker.submit({"op": "end_session", "session_id": session_id}, concurrent.futures.Future())
+
+    def stats(self):
+        with self._lock:
+            return [{"worker": worker.index, "alive": worker.alive, "in_flight": worker.in_flight,
+                     "completed": worker.completed, "sessions": len(worker.sessions)} for worker in self.workers]
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _worker_main(config):
+    # the original stdout becomes the private channel; the banner and other prints go to stderr
+    channel_in = os.dup(0)
+    channel_out = os.fdopen(os.dup(1), "wb")
+    os.dup2(2, 1)
+
+    from functioncall import ModelInference
+    from sandbox import configure_sandbox
+
+    configure_sandbox(size=1)
+    inference = ModelInference(config["model_path"], config["chat_template"], **config["model_options"])
+    sessions = OrderedDict()
+    write_frame(channel_out, pickle.dumps("ready"))
+
+    while True:
+        try:
+            request = pickle.loads(read_frame(channel_in))
+        except EOFError:
+            break
+
+        session_id = request["session_id"]
+        if request["op"] == "end_session":
+            sessions.pop(session_id, None)
+            response = {"result": None}
+        else:
+            try:
+                prompt = inference.generate_function_call(
+                    request["query"], config["chat_template"], request["num_fewshot"], request["max_depth"],
+                    history=sessions.get(session_id), **request["kwargs"]
+                )
+                if session_id is not None:
+                    sessions[session_id] = prompt
+                    sessions.move_to_end(session_id)
+                    if len(sessions) > config["max_sessions"]:
+                        sessions.popitem(last=False)
+                response = {"result": prompt}
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+        write_frame(channel_out, pickle.dumps(response))
+
+
+def read_conversations(input_path):
+    """group {id, session_id, query} records into conversations, keeping the order within each session"""
+    conversations = OrderedDict()
+    with open(input_path, 'r') as file:
+        for line_number, line in enumerate(file):
+            line = line.strip()
+            if line:
+                record = json.loads(line)
+                record_id = str(record.get("id", line_number))
+                session_id = record.get("session_id")
+                conversations.setdefault(session_id or f"query-{record_id}", []).append((record_id, session_id, record["query"]))
+    return list(conversations.values())
+
+
+if __name__ == "__main__" and len(sys.argv) == 3 and sys.argv[1] == "--worker":
+    _worker_main(json.loads(sys.argv[2]))
+
+elif __name__ == "__main__":
+    from model_loader import add_model_arguments, model_options
+    from utils import inference_logger
+
+    parser = argparse.ArgumentParser(description="Serve the function calling loop from several replicas sharing memory-mapped weights")
+    parser.add_argument("--input", type=str, required=True, help="JSONL file of {id, session_id, query} records")
+    parser.add_argument("--output", type=str, required=True, help="JSONL file for the resulting conversations")
+    parser.add_argument("--model_path", type=str, required=True, help="Local model folder with safetensors weights")
+    parser.add_argument("--chat_template", type=str, default="chatml", help="Chat template for prompt formatting")
+    parser.add_argument("--num_fewshot", type=int, default=None, help="Option to use json mode examples")
+    parser.add_argument("--max_depth", type=int, default=5, help="Maximum number of recursive iteration")
+    parser.add_argument("--num_workers", type=int, default=None, help="Number of replica processes (default: one per 4 cores)")
+    parser.add_argument("--threads_per_worker", type=int, default=None, help="Torch threads per replica (default: cores / workers)")
+    add_model_arguments(parser)
+    args = parser.parse_args()
+
+    options = model_options(args)
+    for option in ("device", "mmap_weights", "num_threads"):
+        options.pop(option)
+    pool = ReplicaPool(args.model_path, args.num_workers, args.threads_per_worker, args.chat_template, options)
+    atexit.register(pool.close)
+
+    output = open(args.output, 'w')
+    output_lock = threading.Lock()
+    completed = 0
+
+    def run_conversation(records):
+        # queries of one session depend on each other, so they run one after another
+        global completed
+        for record_id, session_id, query in records:
+            try:
+                record = {"id": record_id, "session_id": session_id, "error": None,
+                          "conversation": pool.generate_function_call(query, session_id, num_fewshot=args.num_fewshot, max_depth=args.max_depth)}
+            except Exception as e:
+                record = {"id": record_id, "session_id": session_id, "error": str(e), "conversation": None}
+            with output_lock:
+                output.write(json.dumps(record, default=str) + "\n")
+                output.flush()
+                completed += 1
+
+    started = time.perf_counter()
+    # two conversations per replica keep every worker busy while the other one is between queries
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2 * len(pool.workers)) as executor:
+        list(executor.map(run_conversation, read_conversations(args.input)))
+    output.close()
+
+    elapsed = time.perf_counter() - started
+    inference_logger.info("Served %d queries in %.1fs (%.3f queries/s): %s", completed, elapsed, completed / elapsed, pool.stats())
@@ -0,0 +1,192 @@
+import uuid
+import pickle
+import struct
+import logging
+
+import numpy as np
+
+from multiprocessing import shared_memory, resource_tracker
+
+# sandbox workers import this module, so avoid importing utils (it sets up log files)
+inference_logger = logging.getLogger("function-calling-inference")
+
+HANDLE_PREFIX = "result://"
+HEADER_SIZE = struct.Struct("!Q")
+ALIGNMENT = 64
+PREVIEW_ROWS = 5
+
+# shared memory blocks attached by open_result in this process, keyed by block name
+_opened_blocks = {}
+# blocks created by a ResultStore in this process
+_owned_blocks = set()
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _encode_values(values):
+    """split pandas/numpy values into (meta, bytes); plain numeric arrays are stored raw so they can be mapped back zero-copy"""
+    import pandas as pd
+
+    meta = {}
+    if isinstance(getattr(values, "dtype", None), pd.DatetimeTZDtype):
+        # store tz-aware timestamps as naive UTC datetime64 and re-localize on open
+        meta["tz"] = str(values.dtype.tz)
+        values = pd.DatetimeIndex(values).tz_convert(None)
+
+    array = np.asarray(values)
+    if array.dtype.kind in "biufcmM" and not array.dtype.hasobject:
+        array = np.ascontiguousarray(array)
+        meta.update({"encoding": "raw", "dtype": array.dtype.str, "shape": array.shape})
+        return meta, array.tobytes()
+
+    meta["encoding"] = "pickle"
+    if isinstance(values, pd.Series):
+        # the index is stored as its own segment
+        values = values.array
+    return meta, pickle.dumps(values, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _decode_values(meta, buffer, offset, size):
+    if meta["encoding"] == "pickle":
+        return pickle.loads(buffer[offset:offset + size])
+
+    array = np.ndarray(meta["shape"], dtype=np.dtype(meta["dtype"]), buffer=buffer, offset=offset)
+    array.flags.writeable = False
+    if "tz" in meta:
+        import pandas as pd
+        return pd.DatetimeIndex(array).tz_localize("UTC").tz_convert(meta["tz"])
+    return array
+
+
+class ResultStore:
+    """
+    Per-session store that keeps tabular tool results in shared memory.
+
+    Each result is written to its own SharedMemory block laid out as a pickled header
+    followed by 64-byte aligned column buffers, so any process on the host can map it
+    with open_result(handle) without copying numeric columns.
+    """
+
+    def __init__(self, session_id=None):
+        self.session_id = session_id or uuid.uuid4().hex[:8]
+        self._blocks = {}
+
+    @staticmethod
+    def is_shareable(value):
+        import pandas as pd
+        return isinstance(value, (pd.DataFrame, pd.Series, np.ndarray))
+
+    def put(self, value):
+        import pandas as pd
+
+        if isinstance(value, pd.DataFrame):
+            meta = {"kind": "DataFrame", "columns": list(value.columns), "index_name": value.index.name}
+            parts = [value.iloc[:, i] for i in range(value.shape[1])]
+            parts.append(value.index)
+        elif isinstance(value, pd.Series):
+            meta = {"kind": "Series", "name": value.name, "index_name": value.index.name}
+            parts = [value, value.index]
+        elif isinstance(value, np.ndarray):
+            meta = {"kind": "ndarray"}
+            parts = [value]
+        else:
+            raise TypeError(f"Cannot share result of type {type(value).__name__}")
+
+        encoded = [_encode_values(part) for part in parts]
+        segments = []
+        offset = 0
+        for part_meta, data in encoded:
+            segments.append(dict(part_meta, offset=offset, size=len(data)))
+            offset = _align(offset + len(data))
+        meta["segments"] = segments
+
+        header = pickle.dumps(meta, protocol=pickle.HIGHEST_PROTOCOL)
+        data_start = _align(HEADER_SIZE.size + len(header))
+        block_name = f"hfc_{self.session_id}_{uuid.uuid4().hex[:12]}"
+        block = shared_memory.SharedMemory(name=block_name, create=True, size=max(data_start + offset, 1))
+
+        HEADER_SIZE.pack_into(block.buf, 0, len(header))
+        block.buf[HEADER_SIZE.size:HEADER_SIZE.size + len(header)] = header
+        for segment, (_, data) in zip(segments, encoded):
+            start = data_start + segment["offset"]
+            block.buf[start:start + len(data)] = data
+
+        self._blocks[block_name] = block
+        _owned_blocks.add(block_name)
+        return f"{HANDLE_PREFIX}{block_name}"
+
+    def share(self, value):
+        """store value and return the short summary that goes into the <tool_response>"""
+        handle = self.put(value)
+        summary = {"handle": handle, "type": type(value).__name__, "shape": list(value.shape)}
+        if hasattr(value, "columns"):
+            summary["columns"] = [str(column) for column in value.columns]
+        if hasattr(value, "head"):
+            # first and last rows; for time series the latest rows are usually what the query is about
+            summary["preview"] = value.to_string(max_rows=2 * PREVIEW_ROWS)
+        summary["usage"] = f"call open_result('{handle}') inside code_interpreter to load the full data without refetching it"
+        inference_logger.info("Stored %s %s as %s", summary['type'], summary['shape'], handle)
+        return summary
+
+    def close(self):
+        for block in self._blocks.values():
+            block.close()
+            try:
+                block.unlink()
+            except FileNotFoundError:
+                pass
+        _owned_blocks.difference_update(self._blocks)
+        self._blocks.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def open_result(handle):
+    """map a result stored by ResultStore; numeric columns are read-only views into shared memory"""
+    if not handle.startswith(HANDLE_PREFIX):
+        raise ValueError(f"Not a result handle: {handle}")
+    block_name = handle[len(HANDLE_PREFIX):]
+
+    block = _opened_blocks.get(block_name)
+    if block is None:
+        block = shared_memory.SharedMemory(name=block_name)
+        if block_name not in _owned_blocks:
+            # the creating session owns the block; stop this process's tracker from unlinking it on exit
+            resource_tracker.unregister(block._name, "shared_memory")
+        _opened_blocks[block_name] = block
+
+    (header_size,) = HEADER_SIZE.unpack_from(block.buf, 0)
+    meta = pickle.loads(block.buf[HEADER_SIZE.size:HEADER_SIZE.size + header_size])
+    data_start = _align(HEADER_SIZE.size + header_size)
+    parts = [
+        _decode_values(segment, block.buf, data_start + segment["offset"], segment["size"])
+        for segment in meta["segments"]
+    ]
+
+    if meta["kind"] == "ndarray":
+        return parts[0]
+
+    import pandas as pd
+    index = pd.Index(parts[-1], name=meta["index_name"])
+    if meta["kind"] == "Series":
+        return pd.Series(parts[0], index=index, name=meta["name"], copy=False)
+    frame = pd.DataFrame(dict(enumerate(parts[:-1])), index=index, copy=False)
+    frame.columns = meta["columns"]
+    return frame
+
+
+def release_results():
+    """close blocks mapped by open_result that are no longer referenced"""
+    for block_name, block in list(_opened_blocks.items()):
+        try:
+            block.close()
+        except BufferError:
+            # a view into the block is still alive, keep it mapped
+            continue
+        del _opened_blocks[block_name]
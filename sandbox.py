@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import time
+import queue
+import pickle
+import atexit
+import inspect
+import logging
+import threading
+import subprocess
+
+from framing import read_frame, write_frame
+
+# workers run this file as a script, so avoid importing utils (it sets up log files)
+inference_logger = logging.getLogger("function-calling-inference")
+
+DEFAULT_PRELOAD = ["numpy", "pandas"]
+
+
+class SandboxWorker:
+    """a pre-started interpreter process that executes code strings under resource limits"""
+
+    def __init__(self, config):
+        self.config = config
+        self.calls = 0
+        self.ready = False
+        env = dict(os.environ)
+        # keep numeric libraries from spawning a thread per core in every worker
+        for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+            env.setdefault(var, "1")
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=env,
+        )
+
+    def wait_ready(self, timeout):
+        if not self.ready:
+            read_frame(self.process.stdout.fileno(), time.monotonic() + timeout)
+            self.ready = True
+
+    def run(self, code, timeout):
+        self.wait_ready(self.config["startup_timeout"])
+        self.calls += 1
+        write_frame(self.process.stdin, pickle.dumps(code))
+        payload = read_frame(
+            self.process.stdout.fileno(),
+            deadline=time.monotonic() + timeout,
+            # leave room for the pickle framing around a truncated result
+            max_bytes=self.config["max_result_bytes"] + 4096,
+        )
+        return pickle.loads(payload)
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.kill()
+
+    def kill(self):
+        if self.process.poll() is None:
+            self.process.kill()
+            self.process.wait()
+
+
+class SandboxPool:
+    """
+    Pool of warm worker processes backing code_interpreter.
+
+    Workers preload common libraries, run each snippet with CPU-time and address-space
+    rlimits, and are replaced in the background after a timeout, a crash or
+    max_calls_per_worker executions.
+    """
+
+    def __init__(self, size=2, timeout=30, cpu_time_limit=30, memory_limit_mb=1024,
+                 max_result_bytes=1 << 20, max_calls_per_worker=100,
+                 startup_timeout=60, preload=None):
+        self.timeout = timeout
+        self.max_calls_per_worker = max_calls_per_worker
+        self.config = {
+            "cpu_time_limit": cpu_time_limit,
+            "memory_limit_mb": memory_limit_mb,
+            "max_result_bytes": max_result_bytes,
+            "startup_timeout": startup_timeout,
+            "preload": DEFAULT_PRELOAD if preload is None else list(preload),
+        }
+        self._idle = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        worker = SandboxWorker(self.config)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _discard(self, worker):
+        worker.kill()
+        with self._lock:
+            self._workers.discard(worker)
+
+    def _replace_in_background(self):
+        def replace():
+            if not self._closed:
+                self._idle.put(self._spawn())
+        threading.Thread(target=replace, daemon=True).start()
+
+    def run(self, code):
+        worker = self._idle.get()
+        healthy = False
+        try:
+            status, value = worker.run(code, self.timeout)
+            healthy = True
+        except TimeoutError:
+            status, value = "error", f"An error occurred: code execution timed out after {self.timeout}s"
+        except OverflowError as e:
+            status, value = "error", f"An error occurred: {e}"
+        except (EOFError, OSError, pickle.UnpicklingError) as e:
+            status, value = "error", f"An error occurred: sandbox worker exited unexpectedly, likely after exceeding its CPU or memory limit ({e})"
+        finally:
+            if healthy and worker.calls < self.max_calls_per_worker:
+                self._idle.put(worker)
+            else:
+                self._discard(worker)
+                self._replace_in_background()
+
+        if status == "error":
+            inference_logger.error(value)
+        return value
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+
+
+_pool = None
+_pool_config = {}
+_pool_lock = threading.Lock()
+
+
+def configure_sandbox(**kwargs):
+    """set SandboxPool options and start the workers so they warm up while the model loads"""
+    global _pool, _pool_config
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+        _pool_config = kwargs
+    return get_sandbox_pool()
+
+
+def get_sandbox_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(**_pool_config)
+        return _pool
+
+
+@atexit.register
+def _shutdown_sandbox():
+    if _pool is not None:
+        _pool.close()
+
+
+# ---------------------------------------------------------------------------
+# worker side
+
+def _set_resource_limits(config):
+    try:
+        import resource
+    except ImportError:
+        return
+
+    memory_limit_mb = config.get("memory_limit_mb")
+    if memory_limit_mb:
+        # budget on top of what the interpreter and preloaded libraries already map
+        try:
+            with open("/proc/self/statm") as statm:
+                current = int(statm.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError):
+            current = 0
+        limit = current + memory_limit_mb * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+
+
+def _set_cpu_budget(cpu_time_limit):
+    """RLIMIT_CPU is cumulative, so move the soft limit forward before every call"""
+    try:
+        import resource
+    except ImportError:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime)
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    soft = used + cpu_time_limit
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def _execute(code, helpers):
+    # Create a new namespace for code execution, seeded with the sandbox helpers
+    exec_namespace = dict(helpers)
+
+    # Execute the code in the new namespace
+    exec(code, exec_namespace)
+
+    # Collect variables and function call results
+    result_dict = {}
+    for name, value in exec_namespace.items():
+        if name in helpers:
+            continue
+        if callable(value):
+            try:
+                result_dict[name] = value()
+            except TypeError:
+                # If the function requires arguments, attempt to call it with arguments from the namespace
+                arg_names = inspect.getfullargspec(value).args
+                args = {arg_name: exec_namespace.get(arg_name) for arg_name in arg_names}
+                result_dict[name] = value(**args)
+        elif not name.startswith('_'):  # Exclude variables starting with '_'
+            result_dict[name] = value
+    return result_dict
+
+
+def _serialize_result(result, max_result_bytes):
+    try:
+        payload = pickle.dumps(result)
+    except Exception:
+        # modules and other unpicklable values are sent back as their repr
+        status, value = result
+        if isinstance(value, dict):
+            value = {name: _picklable(item) for name, item in value.items()}
+        else:
+            value = _picklable(value)
+        result = (status, value)
+        payload = pickle.dumps(result)
+
+    if len(payload) > max_result_bytes:
+        status, value = result
+        text = repr(value)[:max_result_bytes // 2]
+        payload = pickle.dumps((status, f"{text}... [truncated, result exceeded {max_result_bytes} bytes]"))
+    return payload
+
+
+def _picklable(value):
+    try:
+        pickle.dumps(value)
+        return value
+    except Exception:
+        return repr(value)
+
+
+def _worker_main(config):
+    # the original stdin/stdout become the private result channel; prints from
+    # executed code are redirected to stderr so they cannot corrupt it
+    channel_in = os.dup(0)
+    channel_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(2, 1)
+
+    for module in config["preload"]:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+    # open_result maps tool results shared through result_store handles
+    helpers = {}
+    release_results = None
+    try:
+        from result_store import open_result, release_results
+        helpers["open_result"] = open_result
+    except ImportError:
+        pass
+    _set_resource_limits(config)
+    write_frame(channel_out, pickle.dumps("ready"))
+
+    while True:
+        try:
+            code = pickle.loads(read_frame(channel_in))
+        except EOFError:
+            break
+
+        _set_cpu_budget(config["cpu_time_limit"])
+        try:
+            result = ("ok", _execute(code, helpers))
+        except MemoryError:
+            result = ("error", "An error occurred: code exceeded the sandbox memory limit")
+        except BaseException as e:
+            result = ("error", f"An error occurred: {e}")
+        payload = _serialize_result(result, config["max_result_bytes"])
+        del result
+        if release_results is not None:
+            release_results()
+        write_frame(channel_out, payload)
+
+
+if __name__ == "__main__" and len(sys.argv) == 3 and sys.argv[1] == "--worker":
+    _worker_main(json.loads(sys.argv[2]))
@@ -0,0 +1,160 @@
+import threading
+
+import transformers
+from packaging import version
+
+from utils import inference_logger
+
+SPECULATIVE_MODES = ["off", "draft", "prompt_lookup"]
+
+# draft counts come from transformers' private candidate generator hook; it is only
+# wrapped on the releases it was checked against, elsewhere decoding runs without stats
+TRACKED_TRANSFORMERS = (version.parse("4.38.1"), version.parse("4.47"))
+
+
+def can_track_candidates(model):
+    """whether the private candidate generator of this transformers release can be wrapped"""
+    low, high = TRACKED_TRANSFORMERS
+    return low <= version.parse(transformers.__version__) < high and callable(getattr(model, "_get_candidate_generator", None))
+
+
+class SpeculativeDecoder:
+    """
+    Speculative decoding for single-sequence generate calls, with draft acceptance stats.
+
+    A drafter proposes several tokens and the main model checks them all in one forward
+    pass, keeping the longest prefix it agrees with plus one token of its own. Greedy output
+    is the same as without drafting and sampling keeps the main model's distribution;
+    only the number of main model passes changes.
+
+    Args:
+        model: The main model; on tested transformers releases its candidate generator
+            is wrapped to count drafted tokens.
+        mode (str): "draft" uses draft_model as the drafter; "prompt_lookup" copies
+            n-grams already in the prompt, such as names and keys from the tools block.
+        draft_model: Small model sharing the tokenizer of the main model ("draft" mode).
+        num_draft_tokens (int): Tokens the draft model proposes per step to start with;
+            transformers adapts this to the acceptance rate.
+        prompt_lookup_num_tokens (int): Tokens copied per step in "prompt_lookup" mode.
+        max_matching_ngram_size (int): Longest n-gram matched against the prompt.
+    """
+
+    def __init__(self, model, mode="prompt_lookup", draft_model=None, num_draft_tokens=5,
+                 prompt_lookup_num_tokens=10, max_matching_ngram_size=2):
+        if mode not in SPECULATIVE_MODES[1:]:
+            raise ValueError(f"Unknown speculative mode {mode}, expected one of {SPECULATIVE_MODES[1:]}")
+        if mode == "draft" and draft_model is None:
+            raise ValueError("Speculative mode draft needs a draft model")
+        if draft_model is not None and draft_model.config.vocab_size != model.config.vocab_size:
+            raise ValueError("The draft model must share the tokenizer of the main model")
+
+        self.model = model
+        self.mode = mode
+        self.draft_model = draft_model
+        self.prompt_lookup_num_tokens = prompt_lookup_num_tokens
+        self.max_matching_ngram_size = max_matching_ngram_size
+        if draft_model is not None:
+            draft_model.generation_config.num_assistant_tokens = num_draft_tokens
+        self.drafted = 0
+        self.accepted = 0
+        self.steps = 0
+        self._lock = threading.Lock()
+        self.tracked = can_track_candidates(model)
+        if not self.tracked:
+            inference_logger.warning("Speculative decoding stats need transformers >=%s,<%s (found %s); running without them",
+                                     TRACKED_TRANSFORMERS[0], TRACKED_TRANSFORMERS[1], transformers.__version__)
+            return
+
+        get_candidate_generator = model._get_candidate_generator
+
+        def tracked_candidate_generator(*args, **kwargs):
+            return self._track(get_candidate_generator(*args, **kwargs))
+        model._get_candidate_generator = tracked_candidate_generator
+
+    def _track(self, generator):
+        if not (hasattr(generator, "get_candidates") and hasattr(generator, "update_candidate_strategy")):
+            return generator
+        get_candidates = generator.get_candidates
+        update_candidate_strategy = generator.update_candidate_strategy
+        last_drafted = [0]
+
+        def tracked_get_candidates(input_ids):
+            candidate_input_ids, candidate_logits = get_candidates(input_ids)
+            last_drafted[0] = candidate_input_ids.shape[1] - input_ids.shape[1]
+            return candidate_input_ids, candidate_logits
+
+        def tracked_update_candidate_strategy(input_ids, scores, num_matches):
+            with self._lock:
+                self.drafted += last_drafted[0]
+                self.accepted += int(num_matches)
+                self.steps += 1
+            return update_candidate_strategy(input_ids, scores, num_matches)
+
+        generator.get_candidates = tracked_get_candidates
+        generator.update_candidate_strategy = tracked_update_candidate_strategy
+        return generator
+
+    def generate_kwargs(self):
+        if self.mode == "draft":
+            return {"assistant_model": self.draft_model}
+        return {"prompt_lookup_num_tokens": self.prompt_lookup_num_tokens, "max_matching_ngram_size": self.max_matching_ngram_size}
+
+    def close(self):
+        """stop counting drafts for the model"""
+        self.model.__dict__.pop("_get_candidate_generator", None)
+
+    def counts(self):
+        with self._lock:
+            return self.drafted, self.accepted, self.steps
+
+    def stats(self):
+        if not self.tracked:
+            return {"mode": self.mode, "verify_steps": None, "drafted_tokens": None, "accepted_tokens": None,
+                    "acceptance_rate": None, "tokens_per_step": None}
+        drafted, accepted, steps = self.counts()
+        return {
+            "mode": self.mode,
+            "verify_steps": steps,
+            "drafted_tokens": drafted,
+            "accepted_tokens": accepted,
+            "acceptance_rate": round(accepted / drafted, 4) if drafted else None,
+            # every verification pass also adds one token from the main model
+            "tokens_per_step": round((accepted + steps) / steps, 3) if steps else None,
+        }
+
+
+def add_speculative_arguments(parser):
+    """command line options for speculative decoding shared by the inference scripts"""
+    parser.add_argument("--speculative", type=str, default="off", choices=SPECULATIVE_MODES, help="Speculative decoding: off, draft (small draft model) or prompt_lookup (copy n-grams from the prompt)")
+    parser.add_argument("--draft_model_path", type=str, default=None, help="Draft model for --speculative draft; must share the tokenizer of --model_path")
+    parser.add_argument("--num_draft_tokens", type=int, default=5, help="Tokens the draft model proposes per step to start with")
+    parser.add_argument("--prompt_lookup_num_tokens", type=int, default=10, help="Tokens copied from the prompt per step with --speculative prompt_lookup")
+    return parser
+
+
+def setup_speculative_decoding(inference, args, model_options=None):
+    """load the draft model if needed and attach a SpeculativeDecoder built from add_speculative_arguments options"""
+    if args.speculative == "off":
+        return None
+    if getattr(args, "num_candidates", 1) > 1:
+        raise ValueError("Speculative decoding generates one sequence at a time; use it with --num_candidates 1")
+
+    draft_model = None
+    if args.speculative == "draft":
+        if not args.draft_model_path:
+            raise ValueError("--speculative draft needs --draft_model_path")
+        from model_loader import load_model
+
+        # the draft runs next to the main model, so it takes the same device, precision and threads
+        options = dict(model_options or {})
+        options.pop("compile_model", None)
+        options.pop("mmap_weights", None)
+        draft_model = load_model(args.draft_model_path, **options)
+
+    speculative = SpeculativeDecoder(
+        inference.model, args.speculative, draft_model,
+        num_draft_tokens=args.num_draft_tokens, prompt_lookup_num_tokens=args.prompt_lookup_num_tokens,
+    )
+    inference.speculative = speculative
+    inference_logger.info("Speculative decoding with %s", args.speculative if draft_model is None else args.draft_model_path)
+    return speculative
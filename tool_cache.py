@@ -0,0 +1,134 @@
+import json
+import time
+import threading
+import concurrent.futures
+
+from collections import OrderedDict, namedtuple
+
+CACHE_SCOPES = ["none", "session", "global"]
+
+CachePolicy = namedtuple("CachePolicy", ["scope", "ttl"])
+NO_CACHE = CachePolicy("none", None)
+
+# tool name -> CachePolicy, filled by the cache_policy decorator in functions.py
+TOOL_CACHE_POLICIES = {}
+
+
+def cache_policy(scope, ttl=None):
+    """
+    Declare how results of a tool may be reused; apply it on top of @tool.
+
+    Args:
+        scope (str): "none" runs every call; "session" reuses results within one
+            conversation; "global" reuses them across conversations for ttl seconds.
+        ttl (float): Seconds a result stays valid, or None for no expiry.
+    """
+    if scope not in CACHE_SCOPES:
+        raise ValueError(f"Unknown cache scope {scope}, expected one of {CACHE_SCOPES}")
+
+    def register(tool):
+        TOOL_CACHE_POLICIES[getattr(tool, "name", None) or tool.__name__] = CachePolicy(scope, ttl)
+        return tool
+    return register
+
+
+def get_cache_policy(function_name):
+    return TOOL_CACHE_POLICIES.get(function_name, NO_CACHE)
+
+
+def is_cacheable(result):
+    """tools report failures as None or empty results, which are never reused"""
+    if result is None:
+        return False
+    if getattr(result, "empty", False):
+        return False
+    if isinstance(result, (str, dict, list, tuple)) and not result:
+        return False
+    return True
+
+
+class ToolCache:
+    """
+    Memoize tool results by tool name and canonical arguments according to each tool's policy.
+
+    Global results are shared by every conversation in the process and expire after the
+    tool's ttl. Session results live in a dict owned by the conversation. Identical calls
+    that run at the same time wait for the first one instead of calling the tool again.
+    Exceptions and empty results are never stored.
+    """
+
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(function_name, function_args):
+        return function_name + ":" + json.dumps(function_args, sort_keys=True, separators=(",", ":"), default=str)
+
+    def call(self, function_name, function_args, function, session=None):
+        """
+        Run function(*function_args.values()) unless a reusable result exists.
+
+        Returns the result, the tool's policy and how it was served: "off" (no policy),
+        "miss", "hit", or "joined" when it waited for an identical call in progress.
+        """
+        policy = get_cache_policy(function_name)
+        if policy.scope == "none" or (policy.scope == "session" and session is None):
+            return function(*function_args.values()), policy, "off"
+
+        entries = session if policy.scope == "session" else self._entries
+        key = self.key(function_name, function_args)
+        with self._lock:
+            entry = entries.get(key)
+            if entry is not None:
+                expires, result = entry
+                if expires is None or expires > time.monotonic():
+                    if entries is self._entries:
+                        entries.move_to_end(key)
+                    return result, policy, "hit"
+                del entries[key]
+            # session keys are only unique within their conversation
+            flight_key = (id(entries), key)
+            future = self._in_flight.get(flight_key)
+            owner = future is None
+            if owner:
+                future = self._in_flight[flight_key] = concurrent.futures.Future()
+
+        if not owner:
+            return future.result(), policy, "joined"
+
+        try:
+            result = function(*function_args.values())
+        except Exception as e:
+            with self._lock:
+                del self._in_flight[flight_key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._in_flight[flight_key]
+            if is_cacheable(result):
+                entries[key] = (time.monotonic() + policy.ttl if policy.ttl else None, result)
+                if entries is self._entries:
+                    while len(entries) > self.max_entries:
+                        entries.popitem(last=False)
+        future.set_result(result)
+        return result, policy, "miss"
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_tool_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ToolCache()
+        return _cache
@@ -2,34 +2,107 @@ import ast
 import os
 import re
 import json
+import queue
+import atexit
+import random
 import logging
-import datetime
 import xml.etree.ElementTree as ET
 
 from art import text2art
-from logging.handlers import RotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FORMAT = "%(asctime)s,%(msecs)03d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s"
+LOG_DATE_FORMAT = "%Y-%m-%d:%H:%M:%S"
+
+# logging is configured through environment variables so every entry point shares it
+LOG_LEVEL = os.environ.get("HFC_LOG_LEVEL", "INFO").upper()
+LOG_MAX_BYTES = int(os.environ.get("HFC_LOG_MAX_BYTES", 50 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.environ.get("HFC_LOG_BACKUP_COUNT", 5))
+LOG_PAYLOAD_CHARS = int(os.environ.get("HFC_LOG_PAYLOAD_CHARS", 4000))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("HFC_LOG_PAYLOAD_SAMPLE_RATE", 1.0))
+
+logging.basicConfig(format=LOG_FORMAT, datefmt=LOG_DATE_FORMAT, level=logging.INFO)
 
-logging.basicConfig(
-    format="%(asctime)s,%(msecs)03d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s",
-    datefmt="%Y-%m-%d:%H:%M:%S",
-    level=logging.INFO,
-)
 script_dir = os.path.dirname(os.path.abspath(__file__))
-now = datetime.datetime.now()
-log_folder = os.path.join(script_dir, "inference_logs")
+log_folder = os.environ.get("HFC_LOG_DIR", os.path.join(script_dir, "inference_logs"))
 os.makedirs(log_folder, exist_ok=True)
-log_file_path = os.path.join(
-    log_folder, f"function-calling-inference_{now.strftime('%Y-%m-%d_%H-%M-%S')}.log"
-)
-# Use RotatingFileHandler from the logging.handlers module
-file_handler = RotatingFileHandler(log_file_path, maxBytes=0, backupCount=0)
-file_handler.setLevel(logging.INFO)
-
-formatter = logging.Formatter("%(asctime)s,%(msecs)03d %(levelname)-8s [%(filename)s:%(lineno)d] %(message)s", datefmt="%Y-%m-%d:%H:%M:%S")
+log_file_path = os.path.join(log_folder, os.environ.get("HFC_LOG_FILE", "function-calling-inference.log"))
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Hand records to the background listener without formatting them in the calling thread.
+
+    The stock QueueHandler renders the message before enqueueing so records can cross
+    process boundaries; this queue stays in-process, so message arguments (including
+    LogPayload wrappers) are only formatted by the listener thread.
+    """
+
+    def prepare(self, record):
+        return record
+
+
+class LazyQueueListener(QueueListener):
+    """background writer that renders each message once, in its own thread, for all handlers"""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class LogPayload:
+    """
+    Log argument for large values that is serialized, truncated and sampled only when written.
+
+    Args:
+        value: The object to log; non-strings are rendered with json.dumps.
+        indent (int): Indentation for json rendering.
+        max_chars (int): Truncate the rendered text beyond this many characters.
+        sample_rate (float): Fraction of payloads written in full; the rest are replaced by a marker.
+    """
+
+    __slots__ = ("value", "indent", "max_chars", "sample_rate")
+
+    def __init__(self, value, indent=None, max_chars=None, sample_rate=None):
+        self.value = value
+        self.indent = indent
+        self.max_chars = LOG_PAYLOAD_CHARS if max_chars is None else max_chars
+        self.sample_rate = LOG_PAYLOAD_SAMPLE_RATE if sample_rate is None else sample_rate
+
+    def __str__(self):
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return "<payload not sampled>"
+        if isinstance(self.value, str):
+            text = self.value
+        else:
+            try:
+                text = json.dumps(self.value, indent=self.indent, default=str)
+            except (TypeError, ValueError):
+                text = repr(self.value)
+        if self.max_chars and len(text) > self.max_chars:
+            return f"{text[:self.max_chars]}... <truncated {len(text) - self.max_chars} chars>"
+        return text
+
+
+formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+
+# size-based rotation into a stable file name instead of one unbounded file per import
+file_handler = RotatingFileHandler(log_file_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, delay=True)
 file_handler.setFormatter(formatter)
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(formatter)
+
+log_queue = queue.SimpleQueue()
+log_listener = LazyQueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+log_listener.start()
+atexit.register(log_listener.stop)
 
 inference_logger = logging.getLogger("function-calling-inference")
-inference_logger.addHandler(file_handler)
+inference_logger.setLevel(LOG_LEVEL)
+inference_logger.addHandler(LazyQueueHandler(log_queue))
+# the listener writes to the console itself; don't also write synchronously through the root handler
+inference_logger.propagate = False
 
 def print_nous_text_art(suffix=None):
     font = "nancyj"
@@ -54,7 +127,7 @@ def get_chat_template(chat_template):
 
     if not os.path.exists(template_path):
         print
-        inference_logger.error(f"Template file not found: {chat_template}")
+        inference_logger.error("Template file not found: %s", chat_template)
         return None
     try:
         with open(template_path, 'r') as file:
@@ -129,7 +202,7 @@ def validate_and_extract_tool_calls(assistant_content):
 
     except ET.ParseError as err:
         error_message = f"XML Parse Error: {err}"
-        inference_logger.error(f"XML Parse Error: {err}")
+        inference_logger.error("XML Parse Error: %s", err)
 
     # Return default values if no valid data is extracted
     return validation_result, tool_calls, error_message
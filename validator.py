@@ -1,6 +1,8 @@
 import ast
 import json
-from jsonschema import validate
+from functools import lru_cache
+from jsonschema.exceptions import ValidationError as SchemaValidationError
+from jsonschema.validators import validator_for
 from pydantic import ValidationError
 from utils import inference_logger, extract_json_from_markdown
 from schema import FunctionCall, FunctionSignature
@@ -77,6 +79,17 @@ def get_python_type(json_type):
     }
     return type_mapping[json_type]
 
+@lru_cache(maxsize=64)
+def _compile_schema_validator(schema_key):
+    json_schema = json.loads(schema_key)
+    validator_class = validator_for(json_schema)
+    validator_class.check_schema(json_schema)
+    return validator_class(json_schema)
+
+def get_schema_validator(json_schema):
+    """return a compiled jsonschema validator, checking the schema itself only the first time it is seen"""
+    return _compile_schema_validator(json.dumps(json_schema, sort_keys=True))
+
 def validate_json_data(json_object, json_schema):
     valid = False
     error_message = None
@@ -95,29 +108,31 @@ def validate_json_data(json_object, json_schema):
                     result_json = extract_json_from_markdown(json_object)
                 except Exception as e:
                     error_message = f"JSON decoding error: {e}"
-                    inference_logger.info(f"Validation failed for JSON data: {error_message}")
+                    inference_logger.info("Validation failed for JSON data: %s", error_message)
                     return valid, result_json, error_message
 
         # Return early if both json.loads and ast.literal_eval fail
         if result_json is None:
             error_message = "Failed to decode JSON data"
-            inference_logger.info(f"Validation failed for JSON data: {error_message}")
+            inference_logger.info("Validation failed for JSON data: %s", error_message)
             return valid, result_json, error_message
 
+        schema_validator = get_schema_validator(json_schema)
+
         # Validate each item in the list against schema if it's a list
         if isinstance(result_json, list):
             for index, item in enumerate(result_json):
                 try:
-                    validate(instance=item, schema=json_schema)
-                    inference_logger.info(f"Item {index+1} is valid against the schema.")
-                except ValidationError as e:
+                    schema_validator.validate(item)
+                    inference_logger.info("Item %d is valid against the schema.", index + 1)
+                except SchemaValidationError as e:
                     error_message = f"Validation failed for item {index+1}: {e}"
                     break
         else:
             # Default to validation without list
             try:
-                validate(instance=result_json, schema=json_schema)
-            except ValidationError as e:
+                schema_validator.validate(result_json)
+            except SchemaValidationError as e:
                 error_message = f"Validation failed: {e}"
 
     except Exception as e:
@@ -127,6 +142,6 @@ def validate_json_data(json_object, json_schema):
         valid = True
         inference_logger.info("JSON data is valid against the schema.")
     else:
-        inference_logger.info(f"Validation failed for JSON data: {error_message}")
+        inference_logger.info("Validation failed for JSON data: %s", error_message)
 
     return valid, result_json, error_message
\ No newline at end of file